@@ -13,7 +13,7 @@ class ConfigManager:
             self.config = json.load(f)
 
         # Convert paths to absolute paths
-        for key in ['data', 'plotting', 'plots']:
+        for key in ['data', 'plotting', 'plots', 'qc']:
             setattr(self, key, self._load_data_configs(key))
 
     def _load_data_configs(self, key):
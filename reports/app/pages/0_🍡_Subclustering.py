@@ -1,18 +1,22 @@
 import streamlit as st
 
 from TLS.reports.app.app_utils import page_footer
+from TLS.scripts.dataset_store.build_dataset_store import tls_dataset
 from TLS.scripts.pseudotime.plot_subclustering_by_time import make_subclustering_plots
+from TLS.scripts.render_cache.prewarm_render_cache import use_disk_render_cache
 from TLS.src.tls_utils import ignore_warnings
 
 
 @st.cache_resource
 def _make_subclustering_plots():
-    return make_subclustering_plots()
+    # Panels are drawn from the shared render cache
+    return make_subclustering_plots(raster=True, tls_adata=tls_dataset())
 
 
 if __name__ == '__main__':
     st.set_page_config(page_title='Subclustering TLS Cells', page_icon='🍡')
     ignore_warnings()
+    use_disk_render_cache()
     
     subclustering_fig = _make_subclustering_plots()
 
@@ -1,47 +1,40 @@
 from io import BytesIO
+from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np # TODO: Unclear why this is needed
 from PIL import Image
-import scanpy as sc
 import streamlit as st
 
 from TLS.configs.config_manager import config
 from TLS.reports.app.app_utils import page_footer
+from TLS.scripts.dataset_store.build_dataset_store import tls_dataset
+from TLS.scripts.render_cache.prewarm_render_cache import use_disk_render_cache
 from TLS.src.tls_utils import ignore_warnings
+from TLS.src.tls_utils.gene_index import GeneIndex
 
 
 @st.cache_resource
 def get_tls_adata():
-    # TODO: Factor out to src
-    return sc.read(config.data['TLS AnnData']['path'], sparse=True, cache=True)
+    # Memory-mapped store shared by all app processes (see `scripts/dataset_store`);
+    # single-gene reads come from its gene store
+    return tls_dataset()
 
 @st.cache_resource
-def make_gene_umap(gene):
-    fig, ax = plt.subplots(1, 1, figsize=(4, 4), constrained_layout=True)
-    (
-        # Not sure why this works ... can't pass the AnnData directly because it's unhashable
-        tls_adata
-        .tls
-        .umap(ax=ax, color=gene)
-    )
-    cbar = _get_cbar(fig)
-    cbar.set_title('Expression,\nscaled', fontsize=9)
-
-    return fig
+def get_gene_index():
+    # Built once per process from the gene store's names (plus synonyms, if any)
+    synonyms_path = Path(config.data['TLS gene synonyms']['path'])
+    synonyms = GeneIndex.read_synonyms(synonyms_path) if synonyms_path.exists() else None
+    return GeneIndex(get_tls_adata().tls.gene_store.var_names, synonyms=synonyms)
 
-def _get_cbar(fig):
-    cbar = [ax for ax in fig.get_axes() if ax.get_label() == '<colorbar>']
-    try:
-        cbar = cbar[0]
-        return cbar
-    except:
-        # No colorbar
-        pass
+def make_gene_umap(tls_adata, gene):
+    # Immutable PNG bytes from the bounded, thread-safe `render_cache`,
+    # keyed on the dataset version (not a Figure shared across sessions)
+    return tls_adata.tls.render_gene(gene)
 
 if __name__ == '__main__':
     st.set_page_config(page_title='Gene Expression in a 2D Embedding', page_icon='🗾')
     ignore_warnings()
+    use_disk_render_cache()
 
     page_footer(
         page_title='Gene Expression in a 2D Embedding',
@@ -52,22 +45,37 @@ if __name__ == '__main__':
     )
     
     tls_adata = get_tls_adata()
+    gene_index = get_gene_index()
     
-    user_input = st.text_input("Enter a gene name here (e.g., `Cdx2`) and press Enter:")
-    if user_input:
-        st.write(f'You entered: _:blue[{user_input}]_')
+    user_input = st.text_input("Enter a gene name, or its first letters, here (e.g., `Cdx2`) and press Enter:")
+    # Validated against the index, so unknown names never reach the data
+    gene = gene_index.resolve(user_input) if user_input else None
+    if user_input and gene is None:
+        # Streamlit reruns the page on Enter, not on each keystroke, so
+        # completions come from the submitted text; the selectbox then
+        # filters them in the browser as one types
+        suggestions = gene_index.suggest(user_input, limit=50)
+        if suggestions:
+            gene = st.selectbox(f'Genes matching `{user_input}`:', suggestions,
+                                index=None, placeholder='Choose a gene')
+        else:
+            st.write(f'Gene `{user_input}` not found in the data.')
+
+    if gene is not None:
+        st.write(f'You entered: _:blue[{user_input}]_' + (f' (`{gene}`)' if gene != user_input else ''))
         try:
-            gene_umap_fig = make_gene_umap(user_input)
+            gene_umap_fig = make_gene_umap(tls_adata, gene)
             cell_type_ref_img = Image.open('./reports/figures/cell_type_clusters_umap.png')
         
             expr_col, ref_col = st.columns(2)
             with expr_col:
                 st.markdown('Gene expression:')
-                st.pyplot(gene_umap_fig)
+                st.image(gene_umap_fig, width=400,
+                         caption='Expression (minimum to maximum)')
 
             with ref_col:
                 st.markdown('Cell type reference:')
                 st.image(cell_type_ref_img, width=400)
 
         except KeyError:
-            st.write(f'Gene `{user_input}` not found in the data.')
\ No newline at end of file
+            st.write(f'Gene `{gene}` not found in the data.')
\ No newline at end of file
@@ -1,65 +1,43 @@
-import matplotlib.pyplot as plt
-import numpy as np # TODO: Unclear why this is needed
-import scanpy as sc
+from concurrent.futures import CancelledError
+import time
+import uuid
+
 import streamlit as st
 
-from TLS.configs.config_manager import config
 from TLS.data.assets.assets_manager import data_assets
 from TLS.reports.app.app_utils import page_footer
+from TLS.scripts.dataset_store.build_dataset_store import tls_120h_dataset
+from TLS.scripts.render_cache.prewarm_render_cache import render_gene_set_hmap, use_disk_render_cache
 from TLS.src.tls_utils import ignore_warnings
+from TLS.src.tls_utils.jobs import JobCancelled, JobRunner
 
 
 @st.cache_resource
-def get_tls_120hr_adata():
+def get_job_runner():
+    # One per process: sessions asking for the same gene set share its job,
+    # which is cancelled only once every session waiting on it has cancelled
+    return JobRunner(max_workers=2)
+
+
+def make_gene_set_hmap(job, gene_set, data_job):
     # Prepare 120 hr data
-    tls_adata = sc.read(config.data['TLS AnnData']['path'], sparse=True)    
-    tls_adata_120h = (
-        tls_adata
-        .tls
-        .query_timepoints(['Organoid_120h'])
-        .paga(groups='louvain')
-        .louvain(restrict_to=['louvain', ['Seurat_1', 'Seurat_3', 'Seurat_8', 'Seurat_0']], resolution=0, key_added='louvain2')
-        .paga(groups='louvain2')
-        .assign_uns(key='iroot', value_func=lambda ad: np.flatnonzero(ad.obs['louvain2'] == 'Seurat_4')[0])
-        .dpt() # Adds observation 'dpt_pseudotime'
-        .assign_obs(key='iroot', value_func=lambda ad: ad.obs['dpt_pseudotime'])
-        .scale()
-    )
-    return tls_adata_120h
+    # Waits on the preloading job rather than loading the data a second time; that
+    # job was submitted (and so starts) first, so it never waits for a free worker
+    job.report(0.05, 'Preparing data ...')
+    tls_adata_120h = job.wait_for(data_job)
 
-@st.cache_resource
-def make_gene_set_hmap(gene_set):
-    # TODO: Refactor to use extension class built-ins
-    fig, ax = plt.subplots(1, 1, figsize=(4, 4),
-                            # Must be false for `paga_path` to work
-                            constrained_layout=False)
-    (
-        tls_adata_120h
-        # Withouth assigning distance, `paga_path` throws an error because of a type error (??)
-        .assign_obs(key='distance', value_func=lambda ad: ad.obs['dpt_pseudotime'])
-        .paga_path(
-            nodes=["Seurat_4", "Seurat_7", "Seurat_2", "Seurat_5", "Seurat_1-Seurat_3-Seurat_8-Seurat_0,0"],
-            keys=gene_set,
-            show_node_names=False,
-            ytick_fontsize=12,
-            left_margin=0.5,
-            annotations=['distance'],
-            show_colorbar=True,
-            normalize_to_zero_one=True,
-            return_data=True,
-            ax=ax,
-            show=False,
-        )
+    # PNG bytes, prerendered or cached in `render_cache` across sessions;
+    # cancellation is checked between the stages of the plot
+    return render_gene_set_hmap(
+        gene_set, adata=tls_adata_120h,
+        progress=lambda fraction, message: job.report(0.1 + 0.9 * fraction, message),
     )
-    ax.set_frame_on(False)
-    fig.set_size_inches(6, len(gene_set)/4)
-
-    return fig
 
 
 if __name__ == '__main__':
     st.set_page_config(page_title='Pseudotime-Ordered Gene Expression', page_icon='🖼️')
     ignore_warnings()
+    use_disk_render_cache()
     page_footer(
         page_title='Pseudotime-Ordered Gene Expression',
         page_text="""
@@ -68,10 +46,11 @@ if __name__ == '__main__':
         estimated using the diffusion pseudotime method of [Haghverdi16].
         """
     )
-    
-    st.write(f'Preparing data ...')
 
-    tls_adata_120h = get_tls_120hr_adata()
+    job_runner = get_job_runner()
+    session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+    # Start preparing the data while the user picks a gene set
+    data_job = job_runner.submit('tls_120h', lambda job: tls_120h_dataset())
 
     user_input = st.text_input("Enter a gene set name here and press Enter:")
     st.markdown(
@@ -97,8 +76,32 @@ if __name__ == '__main__':
             st.write(f'Gene set `{user_input}` not found in the data.')
             raise
 
-        # Plot data
-        gene_set_hmap_fig = make_gene_set_hmap(gene_set)
+        # Runs in the background; a finished job returns its image at once
+        key = ('gene_set_hmap', user_input, tuple(gene_set))
+        previous_key = st.session_state.get('gene_set_hmap_key')
+        if previous_key is not None and previous_key != key:
+            job_runner.detach(previous_key, session_id)
+        st.session_state['gene_set_hmap_key'] = key
+        job = job_runner.submit(key, make_gene_set_hmap, gene_set, data_job, waiter=session_id)
+        if not job.done():
+            # Clicking reruns the page, which stops waiting here; the job
+            # stops too unless other sessions are waiting on it
+            if st.button('Cancel'):
+                job_runner.detach(key, session_id)
+                st.write('Cancelled.')
+                st.stop()
+
+            progress_bar = st.progress(job.progress, text=job.message)
+            while not job.done():
+                progress_bar.progress(job.progress, text=job.message)
+                time.sleep(0.2)
+            progress_bar.empty()
+
+        try:
+            gene_set_hmap_png = job.result()
+        except (CancelledError, JobCancelled):
+            st.write('Cancelled.')
+            st.stop()
 
         # Show in app
-        st.pyplot(gene_set_hmap_fig)
\ No newline at end of file
+        st.image(gene_set_hmap_png)
\ No newline at end of file
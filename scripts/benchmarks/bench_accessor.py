@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark construction of the `tls` accessor and the cost of each call.
+
+Usage:
+    python TLS/scripts/benchmarks/bench_accessor.py --repeat 1000
+"""
+
+import argparse
+import timeit
+
+import scanpy as sc
+
+from TLS.configs.config_manager import config
+from TLS.src.tls_utils import ignore_warnings
+from TLS.src.tls_utils.anndata_extensions import TLSAnnDataAccessor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str,
+                        default=config.data['TLS AnnData']['path'],
+                        help='Path to the data file')
+    parser.add_argument('--repeat', type=int, default=1000,
+                        help='Number of calls per measurement')
+
+    args = parser.parse_args()
+    
+    return vars(args)
+
+
+def _report(label, seconds, n):
+    print(f'{label:<40} {seconds / n * 1e6:>10.2f} us/call')
+
+
+def bench_accessor():
+    args = parse_args()
+    n = args['repeat']
+    tls_adata = sc.read(args['data'], sparse=True)
+
+    # -- Construction
+    _report('TLSAnnDataAccessor(adata)',
+            timeit.timeit(lambda: TLSAnnDataAccessor(tls_adata), number=n), n)
+    _report('adata.tls (cached)',
+            timeit.timeit(lambda: tls_adata.tls, number=n), n)
+
+    # -- Method resolution
+    _report('fresh accessor + .paga lookup',
+            timeit.timeit(lambda: TLSAnnDataAccessor(tls_adata).paga, number=n), n)
+    _report('adata.tls.paga (cached)',
+            timeit.timeit(lambda: tls_adata.tls.paga, number=n), n)
+
+    # -- Call round trip through a wrapper
+    _report('adata.tls.assign_uns(...)',
+            timeit.timeit(
+                lambda: tls_adata.tls.assign_uns(key='bench', value_func=lambda ad: 0),
+                number=n), n)
+
+
+if __name__ == '__main__':
+    ignore_warnings()
+    bench_accessor()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark p50/p99 latency of single-gene lookups.
+
+Compares the gene store against reading a column of the in-memory and the
+backed expression matrix.
+
+Usage:
+    python TLS/scripts/benchmarks/bench_gene_lookup.py --n-genes 200
+"""
+
+import argparse
+import time
+
+import numpy as np
+import scanpy as sc
+
+from TLS.configs.config_manager import config
+from TLS.src.tls_utils import ignore_warnings
+from TLS.src.tls_utils.gene_store import GeneStore
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str,
+                        default=config.data['TLS AnnData']['path'],
+                        help='Path to the data file')
+    parser.add_argument('--gene-store', type=str,
+                        default=config.data['TLS gene store']['path'],
+                        help='Path to the gene store')
+    parser.add_argument('--n-genes', type=int, default=200,
+                        help='Number of random genes to look up')
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    
+    return vars(args)
+
+
+def _latencies(lookup, genes):
+    latencies = []
+    for gene in genes:
+        start = time.perf_counter()
+        lookup(gene)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+def _report(label, latencies):
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+    print(f'{label:<30} p50 {p50:>10.3f} ms    p99 {p99:>10.3f} ms')
+
+
+def bench_gene_lookup():
+    args = parse_args()
+    store = GeneStore(args['gene_store'])
+    rng = np.random.default_rng(args['seed'])
+    genes = rng.choice(np.asarray(store.var_names), size=args['n_genes'], replace=False)
+
+    def source(adata):
+        return adata.raw if store.meta['use_raw'] else adata
+
+    _report('gene store (mmap)', _latencies(store.get, genes))
+
+    tls_adata = sc.read(args['data'], backed='r')
+    _report('backed h5ad', _latencies(source(tls_adata).obs_vector, genes[:10]))
+
+    tls_adata = sc.read(args['data'])
+    _report('in-memory h5ad', _latencies(source(tls_adata).obs_vector, genes))
+
+
+if __name__ == '__main__':
+    ignore_warnings()
+    bench_gene_lookup()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark runtime and peak RSS of pooled size factors, native vs scran.
+
+Each method runs in a fresh process, so that peak RSS is its own. The R
+path replicates the velocity notebooks (dense transposed matrix through
+`anndata2ri`, `computeSumFactors`) and needs `rpy2` and scran. Factors
+are compared to scran's, or to a stored reference (`--reference`, a CSV
+of scran's factors indexed by cell), failing above `--rtol`.
+
+`--check` compares, without R, the fixture counts in `reference/` to the
+factors scran computed for them (`reference/scran_size_factors.R`).
+
+Usage:
+    python TLS/scripts/benchmarks/bench_size_factors.py --check
+    python TLS/scripts/benchmarks/bench_size_factors.py --counts counts.h5ad --clusters groups
+    python TLS/scripts/benchmarks/bench_size_factors.py --n-cells 5000 --no-r
+"""
+
+import argparse
+import multiprocessing as mp
+from pathlib import Path
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import scanpy as sc
+from scipy import io, sparse
+
+from TLS.src.tls_utils import ignore_warnings
+from TLS.src.tls_utils.size_factors import pooled_size_factors
+
+
+# Fixture counts and scran's factors for them (see scran_size_factors.R)
+REFERENCE_DIR = Path(__file__).parent / 'reference'
+REFERENCE_MAX_CLUSTER_SIZE = 150
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--counts', type=str, default=None,
+                        help='h5ad with raw counts in X (default: simulated counts)')
+    parser.add_argument('--clusters', type=str, default=None,
+                        help='obs column with the clusters to pool within')
+    parser.add_argument('--reference', type=str, default=None,
+                        help='CSV of stored scran size factors, indexed by cell')
+    parser.add_argument('--n-cells', type=int, default=5000)
+    parser.add_argument('--n-genes', type=int, default=10000)
+    parser.add_argument('--min-mean', type=float, default=0.1)
+    parser.add_argument('--max-cluster-size', type=int, default=3000)
+    parser.add_argument('--rtol', type=float, default=0.05,
+                        help='Largest median relative difference to the reference')
+    parser.add_argument('--no-r', action='store_true', help='Skip the R path')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check', action='store_true',
+                        help='Compare the fixture counts to the stored scran factors')
+
+    args = parser.parse_args()
+    if args.check:
+        args.reference = args.reference or str(REFERENCE_DIR / 'scran_size_factors.csv')
+        args.max_cluster_size = REFERENCE_MAX_CLUSTER_SIZE
+        args.no_r = True
+
+    return vars(args)
+
+
+def _simulate(n_cells, n_genes, seed):
+    rng = np.random.default_rng(seed)
+    size_factors = rng.lognormal(0, 0.5, n_cells)
+    clusters = rng.integers(0, 4, n_cells)
+    means = rng.lognormal(-1, 1.5, n_genes)
+    effects = np.ones((4, n_genes))
+    effects[:, :n_genes // 10] = rng.lognormal(0, 1, (4, n_genes // 10))
+    counts = rng.poisson(size_factors[:, None] * means * effects[clusters])
+    obs = pd.DataFrame(dict(groups=pd.Categorical(clusters.astype(str))),
+                       index=[f'cell{i}' for i in range(n_cells)])
+    return sc.AnnData(sparse.csr_matrix(counts, dtype=np.float32), obs=obs)
+
+
+def _fixture():
+    X = io.mmread(str(REFERENCE_DIR / 'size_factor_counts.mtx.gz'))
+    obs = pd.read_csv(REFERENCE_DIR / 'size_factor_clusters.csv', index_col=0, dtype=str)
+    obs['groups'] = pd.Categorical(obs['groups'])
+    return sc.AnnData(sparse.csr_matrix(X, dtype=np.float32), obs=obs)
+
+
+def _load(args):
+    if args['check']:
+        return _fixture(), 'groups'
+    if args['counts'] is None:
+        return _simulate(args['n_cells'], args['n_genes'], args['seed']), 'groups'
+    return sc.read(args['counts']), args['clusters']
+
+
+def _native(adata, clusters, min_mean, max_cluster_size):
+    return pooled_size_factors(adata.X, clusters=clusters, min_mean=min_mean,
+                               max_cluster_size=max_cluster_size)
+
+
+def _scran(adata, clusters, min_mean, max_cluster_size):
+    import anndata2ri
+    from rpy2 import robjects
+    from rpy2.robjects import pandas2ri
+
+    pandas2ri.activate()
+    anndata2ri.activate()
+    robjects.r('suppressPackageStartupMessages(library(scran))')
+    data_mat = adata.X.T.toarray() if sparse.issparse(adata.X) else adata.X.T
+    compute_sum_factors = robjects.r['computeSumFactors']
+    clusters = robjects.FactorVector(np.asarray(clusters).astype(str))
+    return np.asarray(compute_sum_factors(data_mat, clusters=clusters,
+                                          **{'min.mean': min_mean, 'max.cluster.size': max_cluster_size}))
+
+
+def _child(method, args, queue):
+    adata, key = _load(args)
+    clusters = adata.obs[key].values if key is not None else None
+    start = time.perf_counter()
+    factors = method(adata, clusters, args['min_mean'], args['max_cluster_size'])
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((pd.Series(factors, index=adata.obs_names), elapsed, peak))
+
+
+def _run(method, args):
+    queue = mp.get_context('spawn').Queue()
+    process = mp.get_context('spawn').Process(target=_child, args=(method, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _compare(label, factors, reference):
+    reference = reference.reindex(factors.index)
+    rel_diff = np.abs(factors / reference - 1)
+    corr = np.corrcoef(factors, reference)[0, 1]
+    print(f'{label:<30} median rel. diff {np.nanmedian(rel_diff):.4f}    '
+          f'max {np.nanmax(rel_diff):.4f}    corr {corr:.5f}')
+    return np.nanmedian(rel_diff)
+
+
+def bench_size_factors():
+    args = parse_args()
+    if args['reference'] is not None and not Path(args['reference']).exists():
+        sys.exit(f'No stored scran factors at {args["reference"]}; run '
+                 f'`Rscript scran_size_factors.R` in {REFERENCE_DIR} to write them')
+
+    results = {'native': _run(_native, args)}
+    if not args['no_r']:
+        results['scran (rpy2)'] = _run(_scran, args)
+
+    for label, (__, elapsed, peak) in results.items():
+        print(f'{label:<30} {elapsed:>10.2f} s    peak RSS {peak:>10.1f} MB')
+
+    native = results['native'][0]
+    failed = False
+    if 'scran (rpy2)' in results:
+        failed |= _compare('native vs scran', native, results['scran (rpy2)'][0]) > args['rtol']
+    if args['reference'] is not None:
+        reference = pd.read_csv(args['reference'], index_col=0).iloc[:, 0]
+        version_path = Path(args['reference']).with_name('scran_version.txt')
+        if version_path.exists():
+            print(f'stored factors from scran {version_path.read_text().strip()}')
+        failed |= _compare('native vs stored scran', native, reference) > args['rtol']
+    sys.exit(int(failed))
+
+
+if __name__ == '__main__':
+    ignore_warnings()
+    bench_size_factors()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the velocity graph against `scv.tl.velocity_graph`.
+
+Both are computed from the moments, velocities and neighbours of the
+velocity data (`velocity_pipeline.py`); the script reports their runtimes,
+the speedup and the largest difference between the graphs, failing above
+`--atol`.
+
+Usage:
+    python TLS/scripts/benchmarks/bench_velocity_graph.py --n-jobs 8
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import scanpy as sc
+import scvelo as scv
+
+from TLS.configs.config_manager import config
+from TLS.src.tls_utils import ignore_warnings
+from TLS.src.tls_utils.velocity_graph import velocity_graph
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str,
+                        default=config.data['TLS AnnData w/ velocity']['path'],
+                        help='Data with moments, velocity and neighbours')
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help='Workers for both implementations (default: all cores)')
+    parser.add_argument('--max-block-mb', type=float, default=4,
+                        help='Memory of the displacements of a block, per worker')
+    parser.add_argument('--processes', action='store_true',
+                        help='Use a (forkserver) process pool rather than threads')
+    parser.add_argument('--atol', type=float, default=1e-4)
+
+    args = parser.parse_args()
+
+    return vars(args)
+
+
+def _timed(func, adata, **kwargs):
+    adata = adata.copy()
+    start = time.perf_counter()
+    func(adata, **kwargs)
+    return adata, time.perf_counter() - start
+
+
+def bench_velocity_graph():
+    args = parse_args()
+    n_jobs = args['n_jobs'] or scv.core.get_n_jobs(-1)
+
+    adata = sc.read(args['data'])
+    for key in ['velocity_graph', 'velocity_graph_neg']:
+        adata.uns.pop(key, None)
+
+    reference, t_scvelo = _timed(scv.tl.velocity_graph, adata, n_jobs=n_jobs, show_progress_bar=False)
+    result, t_tls = _timed(velocity_graph, adata, max_workers=n_jobs, processes=args['processes'],
+                           max_block_bytes=int(args['max_block_mb'] * 2**20))
+
+    print(f'{"scv.tl.velocity_graph":<30} {t_scvelo:>10.2f} s')
+    print(f'{"tls velocity_graph":<30} {t_tls:>10.2f} s    speedup {t_scvelo / t_tls:.1f}x')
+
+    diffs = [
+        abs(result.uns[key] - reference.uns[key]).max()
+        for key in ['velocity_graph', 'velocity_graph_neg']
+    ]
+    diffs.append(np.abs(result.obs['velocity_self_transition'] - reference.obs['velocity_self_transition']).max())
+    print(f'{"max abs. difference":<30} {max(diffs):>10.2e}')
+    sys.exit(int(max(diffs) > args['atol']))
+
+
+if __name__ == '__main__':
+    ignore_warnings()
+    bench_velocity_graph()
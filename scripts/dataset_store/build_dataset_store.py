@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Build the shared, memory-mapped stores of the TLS data used by the app.
+
+Each store is keyed on its source (the digest of the `.h5ad`, or the key of
+the 120h pipeline's last step), so a changed input gets a new store while
+running processes keep the old one. The app builds missing stores on first
+use; run this beforehand so no page waits for it.
+
+Usage:
+    python TLS/scripts/dataset_store/build_dataset_store.py
+    python TLS/scripts/dataset_store/build_dataset_store.py --root /dev/shm/tls
+"""
+
+import argparse
+from pathlib import Path
+
+import scanpy as sc
+
+from TLS.configs.config_manager import config
+from TLS.scripts.pseudotime.refactored_analyses import TLS_120H_STEPS, process_tls_120h
+from TLS.src.tls_utils import ignore_warnings
+from TLS.src.tls_utils.dataset_store import shared_dataset
+from TLS.src.tls_utils.hashing import file_digest
+from TLS.src.tls_utils.pipeline import CachedPipeline
+
+
+def tls_dataset(path=config.data['TLS AnnData']['path'],
+                root=config.data['TLS dataset store']['path']):
+    """The TLS data (all timepoints), from its shared store."""
+    version = file_digest(path, memo_path=Path(root) / 'file_digests.json')
+    return shared_dataset(root, version, load=lambda: sc.read(path, backed='r'))
+
+
+def tls_120h_dataset(path=config.data['TLS AnnData']['path'],
+                     cache_dir=config.data['TLS pipeline cache']['path'],
+                     root=config.data['TLS dataset store']['path']):
+    """The processed 120h data (`process_tls_120h`), from its shared store."""
+    version = CachedPipeline(TLS_120H_STEPS, cache_dir).keys(path)[-1]
+    return shared_dataset(root, version, load=lambda: process_tls_120h(path, cache_dir)._obj)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str,
+                        default=config.data['TLS AnnData']['path'],
+                        help='Path to the data file')
+    parser.add_argument('--cache-dir', type=str,
+                        default=config.data['TLS pipeline cache']['path'])
+    parser.add_argument('--root', type=str,
+                        default=config.data['TLS dataset store']['path'],
+                        help='Directory to write the stores to')
+
+    args = parser.parse_args()
+
+    return vars(args)
+
+
+if __name__ == '__main__':
+    ignore_warnings()
+    args = parse_args()
+
+    for adata in [
+        tls_dataset(args['data'], root=args['root']),
+        tls_120h_dataset(args['data'], cache_dir=args['cache_dir'], root=args['root']),
+    ]:
+        print(adata.uns['dataset_store']['path'], adata.shape)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Build the per-gene (CSC) sidecar of the TLS AnnData.
+
+Usage:
+    python TLS/scripts/gene_store/build_gene_store.py
+"""
+
+import argparse
+
+import scanpy as sc
+
+from TLS.configs.config_manager import config
+from TLS.src.tls_utils import ignore_warnings
+from TLS.src.tls_utils.gene_store import GeneStore
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str,
+                        default=config.data['TLS AnnData']['path'],
+                        help='Path to the data file')
+    parser.add_argument('--out', type=str,
+                        default=config.data['TLS gene store']['path'],
+                        help='Directory to write the gene store to')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='Number of cells read at a time')
+    parser.add_argument('--use-raw',
+                        default=True,
+                        action=argparse.BooleanOptionalAction)
+
+    args = parser.parse_args()
+    
+    return vars(args)
+
+
+def build_gene_store():
+    args = parse_args()
+    tls_adata = sc.read(args['data'], backed='r')
+
+    return GeneStore.build(
+        tls_adata,
+        args['out'],
+        use_raw=args['use_raw'],
+        chunk_size=args['chunk_size'],
+    )
+
+
+if __name__ == '__main__':
+    ignore_warnings()
+    print(build_gene_store())
@@ -30,15 +30,27 @@ def parse_args():
     parser.add_argument('--from-cache',
                         default=True,
                         action=argparse.BooleanOptionalAction)
+    parser.add_argument('--backed',
+                        default=True,
+                        action=argparse.BooleanOptionalAction,
+                        help='Keep the expression matrix on disk')
+    parser.add_argument('--raster',
+                        default=False,
+                        action=argparse.BooleanOptionalAction,
+                        help='Draw cached, pre-rendered embedding images')
 
     args = parser.parse_args()
     
     return vars(args)
 
 
-def make_subclustering_plots():
+def make_subclustering_plots(raster: bool = None, tls_adata: sc.AnnData = None):
     args = parse_args()
-    tls_adata = sc.read(args['data'], sparse=True, cache=args['from_cache'])
+    if raster is None:
+        raster = args['raster']
+    if tls_adata is None:
+        tls_adata = sc.read(args['data'], sparse=True, cache=args['from_cache'],
+                            backed='r' if args['backed'] else None)
     
     timepoint_plot_params = config.plots[args['plot_param_key']]
     timepoint_plot_params = timepoint_plot_params.items()    
@@ -50,7 +62,7 @@ def make_subclustering_plots():
     for i, (key, params) in enumerate(timepoint_plot_params):
         params['plot_kwargs'] = dict(legend_fontsize=8)
         params['ax'] = fig.add_subplot(gs[i])
-        tls_adata.tls.umap_timepoint(**params)
+        tls_adata.tls.umap_timepoint(**params, raster=raster)
 
         params['ax'].set_title(key)
         if i > 0:
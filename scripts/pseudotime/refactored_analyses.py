@@ -33,6 +33,7 @@ import scanpy as sc
 
 from TLS.configs.config_manager import config
 from TLS.data.assets.assets_manager import data_assets
+from TLS.src.tls_utils.pipeline import CachedPipeline, Step
 
 
 # TODO:
@@ -71,6 +72,29 @@ MYSTERY_PATHS = [('p1', ["Seurat_4", "Seurat_7", "Seurat_2", "Seurat_5","Seurat_
 MYSTERY_NAME = 'p1'
 REMOVE_CLUSTERS_96 = ['Seurat_0-Seurat_1-Seurat_8-Seurat_3,2','Seurat_0-Seurat_1-Seurat_8-Seurat_3,3']
 
+TLS_120H_STEPS = [
+    Step('query_timepoints', dict(timepoints=['Organoid_120h'])),
+    Step('paga', dict(groups='louvain')),
+    Step('louvain', dict(restrict_to=['louvain', MYSTERY_CLUSTERS], resolution=0, key_added='louvain2')),
+    Step('paga', dict(groups='louvain2')),
+    Step('assign_uns', dict(key='iroot', value_func=lambda ad: np.flatnonzero(ad.obs['louvain2'] == MYSTERY_IROOT)[0])),
+    Step('dpt', checkpoint=True), # Adds observation 'dpt_pseudotime'
+    Step('assign_obs', dict(key='iroot', value_func=lambda ad: ad.obs['dpt_pseudotime'])),
+    Step('scale'),
+]
+
+
+def process_tls_120h(path=config.data['TLS AnnData']['path'],
+                     cache_dir=config.data['TLS pipeline cache']['path'],
+                     backed='r'):
+    """
+    TLS 120h data processing (PAGA, sub-clustering, DPT, scaling).
+
+    Results of each step are cached on disk, keyed on the input file and
+    the steps' parameters, so only changed steps are recomputed.
+    """
+    return CachedPipeline(TLS_120H_STEPS, cache_dir).run(path, backed=backed)
+
 
 # TODO: Factor out these common palettes to `src` and `config`
 reds_cmap = mpl.colormaps['Reds'](np.linspace(0, 1, 128))
@@ -87,6 +111,10 @@ def parse_args():
     parser.add_argument('--from-cache',
                         default=True,
                         action=argparse.BooleanOptionalAction)
+    parser.add_argument('--backed',
+                        default=True,
+                        action=argparse.BooleanOptionalAction,
+                        help='Keep the expression matrix on disk')
 
     args = parser.parse_args()
     
@@ -98,23 +126,14 @@ if __name__ == '__main__':
     # --
     args = parse_args()
     figures_dir = Path(config.plotting['output'])
-    tls_adata = sc.read(args['data'], sparse=True, cache=args['from_cache'])    
+    tls_adata = sc.read(args['data'], sparse=True, cache=args['from_cache'],
+                        backed='r' if args['backed'] else None)    
+    # Repeated scanpy calls on the same cells replay their results
+    tls_adata.tls.memoize()
     
     
     # -- TLS 120h data processing
-    tls_adata_120h = (
-        tls_adata
-        .tls
-        .copy()
-        .query_timepoints(['Organoid_120h'])
-        .paga(groups='louvain')
-        .louvain(restrict_to=['louvain', MYSTERY_CLUSTERS], resolution=0, key_added='louvain2')
-        .paga(groups='louvain2')
-        .assign_uns(key='iroot', value_func=lambda ad: np.flatnonzero(ad.obs['louvain2'] == MYSTERY_IROOT)[0])
-        .dpt() # Adds observation 'dpt_pseudotime'
-        .assign_obs(key='iroot', value_func=lambda ad: ad.obs['dpt_pseudotime'])
-        .scale()
-    )
+    tls_adata_120h = process_tls_120h(args['data'], backed='r' if args['backed'] else None)
 
 
     # -- TLS 120h 'diffmap'
@@ -141,38 +160,21 @@ if __name__ == '__main__':
     # plt.savefig(figures_dir / 'some_umap.pdf')
     
     
-    # -- Somitic trajectory
-    # TODO:
-    _FROM_CONFIG = dict(
-        color_map=red_grey_r_cmap
-    )
-    (
-        tls_adata_120h
-        .pagapath_hmap(MYSTERY_PATHS[0][1],
-                       data_assets.somitic_trajectory_genes,
-                       plot_kwargs=_FROM_CONFIG,
-                       height=6,
-                       save_df=True,
-                       name=MYSTERY_NAME, # TODO: shouldn't this be 'somitic'?
-                       )
-    )
-    # plt.savefig(figures_dir / 'Figure_5A_PAGApaths.pdf')
-
-
-    # -- Neural trajectory
+    # -- Somitic and neural trajectories
     # TODO:
     _FROM_CONFIG = dict(
         color_map=red_grey_r_cmap
     )
+    # Both gene sets share the path, so cells are ordered and read once
     (
         tls_adata_120h
-        .pagapath_hmap(MYSTERY_PATHS[0][1],
-                       data_assets.neural_trajectory_genes,
-                       plot_kwargs=_FROM_CONFIG,
-                       height=6,
-                       save_df=True,
-                       name=MYSTERY_NAME, # TODO: shouldn't this be 'neural'?
-                       )
+        .pagapath_hmaps(MYSTERY_PATHS[0][1],
+                        dict(somitic=data_assets.somitic_trajectory_genes,
+                             neural=data_assets.neural_trajectory_genes),
+                        plot_kwargs=_FROM_CONFIG,
+                        height=6,
+                        save_df=True,
+                        )
     )
     # plt.savefig(figures_dir / 'Figure_5A_PAGApaths.pdf')
 
@@ -181,7 +183,7 @@ if __name__ == '__main__':
     tls_adata_all_hox = (
         tls_adata
         .tls
-        .copy()
+        .lazy()
         .query_clusters(method='louvain', clusters=HOX_CLUSTERS.values())
         .paga(groups='donor')
         
@@ -256,7 +258,7 @@ if __name__ == '__main__':
     tls_adata_neuro = (
         tls_adata
         .tls
-        .copy()
+        .lazy()
         .query_clusters(method='louvain', clusters=[CLUSTER_REF.neuro2])
     )
     
@@ -284,7 +286,7 @@ if __name__ == '__main__':
     tls_adata_somite = (
         tls_adata
         .tls
-        .copy()
+        .lazy()
         .query_clusters(method='louvain', clusters=SOMITE_CLUSTERS.values())
         
         # TODO: Unclear if calling this before rendering initial UMAP is correct:
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Prerender the app's images into the on-disk render cache.
+
+Renders the Gene UMAP of the `--top-n` most detected genes (plus any in
+`--genes`) and the pseudotime heatmap of every gene set in `data_assets`,
+on a pool of processes that map the same data stores. The app
+reads the images from the same directory, so the first request for any
+of them is served without plotting. Images already on disk are skipped.
+
+Usage:
+    python TLS/scripts/render_cache/prewarm_render_cache.py
+    python TLS/scripts/render_cache/prewarm_render_cache.py --top-n 2000 --n-jobs 8
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from TLS.configs.config_manager import config
+from TLS.data.assets.assets_manager import data_assets
+from TLS.scripts.dataset_store.build_dataset_store import tls_120h_dataset, tls_dataset
+from TLS.scripts.pseudotime.refactored_analyses import MYSTERY_NAME, MYSTERY_PATHS
+from TLS.src.tls_utils import ignore_warnings
+from TLS.src.tls_utils.rendering import render_cache
+
+
+# Path and arguments of the Heatmap page
+HEATMAP_NODES = dict(MYSTERY_PATHS)[MYSTERY_NAME]
+HEATMAP_PLOT_KWARGS = dict(annotations=['distance'])
+
+
+def use_disk_render_cache(path=config.data['TLS render cache']['path']):
+    """Read (and write) rendered images in the shared directory."""
+    render_cache.set_disk_dir(path)
+
+
+def gene_set_names():
+    return [name for name in data_assets.all_assets if name.endswith('_genes')]
+
+
+def render_gene_umap(gene, adata=None):
+    adata = tls_dataset() if adata is None else adata
+    return adata.tls.render_gene(gene)
+
+
+def render_gene_set_hmap(gene_set, adata=None, progress=None):
+    """PNG of the Heatmap page's figure for `gene_set` (`progress` as in `pagapath_hmaps`)."""
+    adata = tls_120h_dataset() if adata is None else adata
+    return adata.tls.render_pagapath_hmap(HEATMAP_NODES, gene_set, plot_kwargs=HEATMAP_PLOT_KWARGS,
+                                          progress=progress)
+
+
+def top_genes(n, adata=None):
+    """The `n` genes detected in the most cells."""
+    adata = tls_dataset() if adata is None else adata
+    store = adata.tls.gene_store
+    n_cells = np.diff(store.indptr)
+    return [str(gene) for gene in store.var_names[np.argsort(-n_cells, kind='stable')[:n]]]
+
+
+# Stores attached in each worker
+_datasets = {}
+
+
+def _init_worker(output):
+    """
+    Attach the stores (built by the parent) and the render cache.
+
+    Workers come from a `forkserver` rather than a fork of the parent,
+    whose numba/OpenMP threads can leave forked children hanging; mapping
+    the stores again costs no copy of the data.
+    """
+    use_disk_render_cache(output)
+    _datasets.update(genes=tls_dataset(), gene_sets=tls_120h_dataset())
+
+
+def _prewarm(task):
+    kind, name = task
+    start = time.perf_counter()
+    try:
+        if kind == 'gene':
+            render_gene_umap(name, adata=_datasets['genes'])
+        else:
+            render_gene_set_hmap(getattr(data_assets, name), adata=_datasets['gene_sets'])
+    except (KeyError, ValueError) as e:
+        return kind, name, time.perf_counter() - start, repr(e)
+    return kind, name, time.perf_counter() - start, None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--top-n', type=int, default=500,
+                        help='Number of most detected genes to render')
+    parser.add_argument('--genes', type=str, default=None,
+                        help='File with more genes to render, one per line')
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help='Worker processes (default: all cores)')
+    parser.add_argument('--output', type=str,
+                        default=config.data['TLS render cache']['path'],
+                        help='Directory of the render cache')
+
+    args = parser.parse_args()
+
+    return vars(args)
+
+
+def prewarm_render_cache():
+    args = parse_args()
+    use_disk_render_cache(args['output'])
+
+    # Build the stores once, before the workers attach them
+    tls_120h_dataset()
+    genes = top_genes(args['top_n'], adata=tls_dataset())
+    if args['genes'] is not None:
+        with open(args['genes']) as f:
+            genes += [line.strip() for line in f if line.strip() and line.strip() not in genes]
+    tasks = [('gene_set', name) for name in gene_set_names()] + [('gene', gene) for gene in genes]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args['n_jobs'], mp_context=mp.get_context('forkserver'),
+                             initializer=_init_worker, initargs=(args['output'],)) as executor:
+        results = list(executor.map(_prewarm, tasks, chunksize=8))
+
+    for kind, name, seconds, error in results:
+        if error is not None:
+            print(f'{kind:<10} {name:<30} failed: {error}')
+    n_failed = sum(error is not None for *__, error in results)
+    print(f'{len(results) - n_failed} images in {args["output"]} '
+          f'({n_failed} failed) in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    ignore_warnings()
+    prewarm_render_cache()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Velocity stream, arrow and grid plots from the stored velocity data.
+
+Reads the output of `velocity_pipeline.py` (velocity layers, transition
+graph and UMAP projection), so no velocity step is recomputed.
+
+Usage:
+    python TLS/scripts/velocity/plot_velocity.py
+    python TLS/scripts/velocity/plot_velocity.py --gene Tmsb10 --color louvain
+"""
+
+import argparse
+from pathlib import Path
+
+import scanpy as sc
+import scvelo as scv
+
+from TLS.configs.config_manager import config
+from TLS.src.tls_utils import ignore_warnings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str,
+                        default=config.data['TLS AnnData w/ velocity']['path'],
+                        help='Data with velocity (from `velocity_pipeline.py`)')
+    parser.add_argument('--color', type=str, default='louvain')
+    parser.add_argument('--gene', type=str, default='Tmsb10',
+                        help='Gene for the grid plot')
+    parser.add_argument('--output', type=str,
+                        default=config.plotting['output'],
+                        help='Directory for the figures')
+
+    args = parser.parse_args()
+
+    return vars(args)
+
+
+if __name__ == '__main__':
+    ignore_warnings()
+    args = parse_args()
+    figures_dir = Path(args['output'])
+    figures_dir.mkdir(parents=True, exist_ok=True)
+
+    adata = sc.read(args['data'])
+
+    scv.pl.velocity_embedding_stream(adata, legend_loc='on data', alpha=.05, color=args['color'],
+                                     save=str(figures_dir / 'velocity_stream.png'), show=False)
+    scv.pl.velocity_embedding(adata, basis='umap', dpi=600, color=args['color'],
+                              save=str(figures_dir / 'velocity_embedding.png'), show=False)
+    scv.pl.velocity_embedding_grid(adata, color=args['gene'], layer=['velocity', 'spliced'], colorbar=True,
+                                   save=str(figures_dir / f'velocity_grid_{args["gene"]}.png'), show=False)
@@ -16,6 +16,14 @@ import logging
 from rpy2.robjects import pandas2ri
 import anndata2ri
 
+from TLS.configs.config_manager import config
+from TLS.scripts.velocity.velocity_pipeline import process_velocity
+from TLS.src.tls_utils.io import join_metadata, load_timepoints
+from TLS.src.tls_utils.pipeline import Stage, StagePipeline
+from TLS.src.tls_utils.preprocessing import regress_out, scale
+from TLS.src.tls_utils.qc import qc_filter
+from TLS.src.tls_utils.size_factors import normalize_size_factors
+
 rpy2.rinterface_lib.callbacks.logger.setLevel(logging.ERROR)
 
 pandas2ri.activate()
@@ -29,131 +37,21 @@ sc.logging.print_versions()
 get_ipython().run_cell_magic('R', '', '# Load all the R libraries we will be using in the notebook\nlibrary(scran)\nlibrary(RColorBrewer)\nlibrary(slingshot)\nlibrary(monocle)\nlibrary(gam)\nlibrary(clusterExperiment)\nlibrary(ggplot2)\nlibrary(plyr)\nlibrary(MAST)')
 
 
-# Load data
-data_file = 'TLS_120h/outs/filtered_feature_bc_matrix/matrix.mtx.gz'
-barcode_file = 'TLS_120h/outs/filtered_feature_bc_matrix/barcodes.tsv.gz'
-gene_file = 'TLS_120h/outs/filtered_feature_bc_matrix/features.tsv.gz'
-
-adata = sc.read(data_file, cache=True)
-adata = adata.transpose()
-adata.X = adata.X.toarray()
-barcodes = pd.read_csv(barcode_file, header=None, sep='\t')
-genes = pd.read_csv(gene_file, header=None, sep='\t')
-genes = genes.drop(2, axis=1)
-
-barcodes.rename(columns={0:'barcode'}, inplace=True)
-barcodes.set_index('barcode', inplace=True)
-adata.obs = barcodes
-adata.obs['sample'] = 'TLS_120h'
-adata.obs['region'] = 'TLS'
-adata.obs['donor'] = 'TLS_120h'
-
-genes.rename(columns={0:'gene_id', 1:'gene_symbol'}, inplace=True)
-genes.set_index('gene_symbol', inplace=True)
-adata.var = genes
-
-adata_120h = adata
-
-
-# Load data
-data_file = 'TLS_96h/outs/filtered_feature_bc_matrix/matrix.mtx.gz'
-barcode_file = 'TLS_96h/outs/filtered_feature_bc_matrix/barcodes.tsv.gz'
-gene_file = 'TLS_96h/outs/filtered_feature_bc_matrix/features.tsv.gz'
-
-adata = sc.read(data_file, cache=True)
-adata = adata.transpose()
-adata.X = adata.X.toarray()
-barcodes = pd.read_csv(barcode_file, header=None, sep='\t')
-genes = pd.read_csv(gene_file, header=None, sep='\t')
-genes = genes.drop(2, axis=1)
-
-barcodes.rename(columns={0:'barcode'}, inplace=True)
-barcodes.set_index('barcode', inplace=True)
-adata.obs = barcodes
-adata.obs['sample'] = 'TLS_96h'
-adata.obs['region'] = 'TLS'
-adata.obs['donor'] = 'TLS_96h'
-
-genes.rename(columns={0:'gene_id', 1:'gene_symbol'}, inplace=True)
-genes.set_index('gene_symbol', inplace=True)
-adata.var = genes
-
-adata_96h = adata
-
-
-# Load data
-data_file = 'TLS_108h/outs/filtered_feature_bc_matrix/matrix.mtx.gz'
-barcode_file = 'TLS_108h/outs/filtered_feature_bc_matrix/barcodes.tsv.gz'
-gene_file = 'TLS_108h/outs/filtered_feature_bc_matrix/features.tsv.gz'
-
-#Load data
-adata = sc.read(data_file, cache=True)
-adata = adata.transpose()
-adata.X = adata.X.toarray()
-barcodes = pd.read_csv(barcode_file, header=None, sep='\t')
-genes = pd.read_csv(gene_file, header=None, sep='\t')
-genes = genes.drop(2, axis=1)
-
-#Annotate data
-barcodes.rename(columns={0:'barcode'}, inplace=True)
-barcodes.set_index('barcode', inplace=True)
-adata.obs = barcodes
-adata.obs['sample'] = 'TLS_108h'
-adata.obs['region'] = 'TLS'
-adata.obs['donor'] = 'TLS_108h'
-
-genes.rename(columns={0:'gene_id', 1:'gene_symbol'}, inplace=True)
-genes.set_index('gene_symbol', inplace=True)
-adata.var = genes
-
-adata_108h = adata
-
-
-# Concatenate to main adata object
-adata = adata_120h.concatenate(adata_108h, batch_key='sample')
-adata.var['gene_id'] = adata.var['gene_id-1']
-adata.var.drop(columns = ['gene_id-1', 'gene_id-0'], inplace=True)
-adata.obs_names = [c.split("-")[0] for c in adata.obs_names]
-adata.obs_names_make_unique(join='_')
-adata.var_names_make_unique()
-adata.obs_names_make_unique()
-
-adata = adata.concatenate(adata_96h, batch_key='sample')
-adata.var['gene_id'] = adata.var['gene_id-1']
-adata.var.drop(columns = ['gene_id-1', 'gene_id-0'], inplace=True)
-adata.obs_names = [c.split("-")[0] for c in adata.obs_names]
-adata.obs_names_make_unique(join='_')
-adata.var_names_make_unique()
-adata.obs_names_make_unique()
-
+# Load data (sparse, concurrently) and concatenate in one pass
+adata = load_timepoints({
+    f'{tp}/outs/filtered_feature_bc_matrix': dict(obs=dict(sample=tp, region='TLS', donor=tp))
+    for tp in ['TLS_120h', 'TLS_108h', 'TLS_96h']
+})
 adata.obs['sample'] = adata.obs['donor']
-adata.var_names_make_unique()
-adata.obs_names_make_unique()
 
 
 # Add UMAP from Seurat clustering
-meta = pd.read_csv('UMAP.tsv', sep='\t')
-adata = adata[[i for i,x in enumerate(adata.obs.index) if x in np.array([meta['BC']])],]
-meta.set_index('BC', inplace=True)
-adata.obs['UMAP1'] = [meta['UMAP_1']][0][adata.obs.index]
-adata.obs['UMAP2'] = [meta['UMAP_2']][0][adata.obs.index]
+adata = join_metadata(adata, ('UMAP.tsv', {'UMAP_1': 'UMAP1', 'UMAP_2': 'UMAP2'}))
 
 
 # Pre-processing and visualization
-adata.obs['n_counts'] = adata.X.sum(1)
-adata.obs['log_counts'] = np.log(adata.obs['n_counts'])
-adata.obs['n_genes'] = (adata.X > 0).sum(1)
-
-mt_gene_mask = [gene.startswith('mt-') for gene in adata.var_names]
-adata.obs['mt_frac'] = adata.X[:, mt_gene_mask].sum(1)/adata.obs['n_counts']
-
-# Filter cells according to identified QC thresholds:
-sc.pp.filter_cells(adata, min_counts = 10000)
-sc.pp.filter_cells(adata, max_counts = 40000)
-adata = adata[adata.obs['mt_frac'] < 0.1]
-sc.pp.filter_cells(adata, min_genes = 3000)
-adata.var_names_make_unique()
-sc.pp.filter_genes(adata, min_cells=20)
+# QC metrics and all cell/gene filters in one pass (thresholds in `configs/config.json`)
+adata = qc_filter(adata, **config.qc['velocity'])
 
 
 # Normalization
@@ -164,36 +62,20 @@ sc.pp.pca(adata_pp, n_comps=15)
 sc.pp.neighbors(adata_pp)
 sc.tl.louvain(adata_pp, key_added='groups', resolution=1)
 
+# Pooled size factors from scran itself: the native port (`size_factors.pooled_size_factors`)
+# replaces this once `bench_size_factors.py --check` passes against stored scran output
 input_groups = adata_pp.obs['groups']
 data_mat = adata.X.T
 get_ipython().run_cell_magic('R', '-i data_mat -i input_groups -o size_factors', '\nsize_factors = computeSumFactors(data_mat, clusters=input_groups, min.mean=0.1)')
 del adata_pp
 
 adata.obs['size_factors'] = size_factors
-adata.layers["counts"] = adata.X.copy()
-
-adata.X /= adata.obs['size_factors'].values[:,None]
-sc.pp.log1p(adata)
-
-adata.raw = adata
-
 
-# Highly Variable Genes
-sc.pp.highly_variable_genes(adata, flavor='cell_ranger', n_top_genes=4000)
+# Scale and log the non-zeros in place; counts and raw share the matrix structure
+normalize_size_factors(adata, counts_layer='counts', raw=True)
 
-# Visualization
-sc.pp.pca(adata, n_comps=50, use_highly_variable=True, svd_solver='arpack')
-sc.pp.neighbors(adata)
 
-sc.tl.tsne(adata)
-sc.tl.umap(adata)
-sc.tl.diffmap(adata)
-sc.tl.draw_graph(adata)
-
-adata.obsm['X_umap'] = np.array(adata.obs[['UMAP1','UMAP2']])
-
-
-# Cell cycle scoring
+# Cell cycle genes
 cc_genes = pd.read_table('Macosko_cell_cycle_genes.txt', delimiter='\t')
 s_genes = cc_genes['S'].dropna()
 g2m_genes = cc_genes['G2.M'].dropna()
@@ -204,54 +86,70 @@ g2m_genes_mm = [gene.lower().capitalize() for gene in g2m_genes]
 s_genes_mm_ens = adata.var_names[np.in1d(adata.var_names, s_genes_mm)]
 g2m_genes_mm_ens = adata.var_names[np.in1d(adata.var_names, g2m_genes_mm)]
 
-sc.tl.score_genes_cell_cycle(adata, s_genes=s_genes_mm_ens, g2m_genes=g2m_genes_mm_ens)
+
+# Preprocessing, declared by the products each step reads and writes. Only
+# the steps feeding the targets run: the embeddings below are replaced by the
+# Seurat UMAP or never looked at, and are skipped (see the report).
+def set_seurat_umap(adata):
+    adata.obsm['X_umap'] = np.array(adata.obs[['UMAP1','UMAP2']])
+
+
+def embeddings(suffix=''):
+    return [
+        Stage(f'tsne{suffix}', sc.tl.tsne, reads=['obsm/X_pca'], writes=['obsm/X_tsne']),
+        Stage(f'umap{suffix}', sc.tl.umap, reads=['uns/neighbors'], writes=['obsm/X_umap']),
+        Stage(f'diffmap{suffix}', sc.tl.diffmap, reads=['uns/neighbors'], writes=['obsm/X_diffmap']),
+        Stage(f'draw_graph{suffix}', sc.tl.draw_graph, reads=['uns/neighbors'], writes=['obsm/X_draw_graph_fa']),
+        Stage(f'seurat_umap{suffix}', set_seurat_umap, reads=['obs/UMAP1', 'obs/UMAP2'], writes=['obsm/X_umap']),
+    ]
+
+
+preprocessing = StagePipeline(
+    [
+        Stage('highly_variable_genes', sc.pp.highly_variable_genes, dict(flavor='cell_ranger', n_top_genes=4000),
+              reads=['X'], writes=['var/highly_variable']),
+        Stage('pca', sc.pp.pca, dict(n_comps=50, use_highly_variable=True, svd_solver='arpack'),
+              reads=['X', 'var/highly_variable'], writes=['obsm/X_pca']),
+        Stage('neighbors', sc.pp.neighbors, reads=['obsm/X_pca'], writes=['uns/neighbors']),
+        *embeddings(),
+        Stage('score_genes_cell_cycle', sc.tl.score_genes_cell_cycle,
+              dict(s_genes=s_genes_mm_ens, g2m_genes=g2m_genes_mm_ens),
+              reads=['X'], writes=['obs/S_score', 'obs/G2M_score', 'obs/phase']),
+        Stage('regress_out', regress_out, dict(keys=['S_score', 'G2M_score']),
+              reads=['X', 'obs/S_score', 'obs/G2M_score'], writes=['X']),
+        Stage('scale', scale, reads=['X'], writes=['X']),
+        Stage('pca (regressed)', sc.pp.pca, dict(n_comps=50, svd_solver='arpack'),
+              reads=['X', 'var/highly_variable'], writes=['obsm/X_pca']),
+        Stage('neighbors (regressed)', sc.pp.neighbors, reads=['obsm/X_pca'], writes=['uns/neighbors']),
+        *embeddings(' (regressed)'),
+        # Replaced by the Seurat clusters below
+        Stage('louvain_r1', sc.tl.louvain, dict(resolution=1, key_added='louvain_r1'),
+              reads=['uns/neighbors'], writes=['obs/louvain_r1']),
+    ],
+    # Used by scvelo (moments, velocity_embedding) and the plots
+    targets=['X', 'obsm/X_pca', 'obsm/X_umap', 'obs/S_score', 'obs/G2M_score', 'obs/phase'],
+)
+print(preprocessing.report())
+adata = preprocessing.run(adata)
 
 sc.pl.umap(adata, color=['S_score', 'G2M_score'], use_raw=False)
 sc.pl.umap(adata, color='phase', use_raw=False)
-sc.pp.regress_out(adata, ['S_score', 'G2M_score'])
-
-sc.pp.scale(adata)
-sc.pp.pca(adata, n_comps=50, svd_solver='arpack')
-sc.pp.neighbors(adata)
-
-sc.tl.tsne(adata)
-sc.tl.umap(adata)
-sc.tl.diffmap(adata)
-sc.tl.draw_graph(adata)
-
-adata.obsm['X_umap'] = np.array(adata.obs[['UMAP1','UMAP2']])
 
 
 # ## 3.1 Clustering
-# Perform clustering - using highly variable genes
-sc.tl.louvain(adata, resolution=1, key_added='louvain_r1')
-adata.obs['louvain_r1'].value_counts()
-
 # use seurat clustering
-adata.obs['louvain']  = adata.obs['louvain_r1']
-
-meta = pd.read_csv('TLS_cluster.tsv', sep='\t')
-meta.set_index('BC', inplace=True)
-adata.obs['louvain'] = [meta['seurat_clusters']][0][adata.obs.index]
+adata = join_metadata(adata, ('TLS_cluster.tsv', {'seurat_clusters': 'louvain'}), drop_unmatched=False)
 
 
 
 
 # velocity
 ## Read and merge velocity
-adata_loom_120 = scv.read("TLS_120h/velocyto/TLS_120h.loom", sparse=True, cache=True)
-adata_loom_120.var_names_make_unique()
-adata_loom_108 = scv.read("TLS_108h/velocyto/TLS_108h.loom", sparse=True, cache=True)
-adata_loom_108.var_names_make_unique()
-adata_loom_96 = scv.read("TLS_96h/velocyto/TLS_96h.loom", sparse=True, cache=True)
-adata_loom_96.var_names_make_unique()
-
-loom = adata_loom_120.concatenate(adata_loom_108)
-loom.var_names_make_unique()
-loom.obs_names_make_unique()
-loom = loom.concatenate(adata_loom_96)
-loom.var_names_make_unique()
-loom.obs_names_make_unique()
+loom = load_timepoints(
+    {f'{tp}/velocyto/{tp}.loom': dict(sparse=True, cache=True) for tp in ['TLS_120h', 'TLS_108h', 'TLS_96h']},
+    read=scv.read,
+    barcode_sep=None,
+)
 
 ## merge loom file into an already existing AnnData object
 adata = scv.utils.merge(adata, loom)
@@ -260,18 +158,11 @@ adata.obs_names_make_unique()
 
 scv.utils.show_proportions(adata)
 
-## Preprocess the data
-scv.pp.filter_and_normalize(adata, min_counts=20, min_counts_u=10, n_top_genes=3000)
-scv.pp.moments(adata, n_pcs=50, n_neighbors=30)
-
-## Compute velocity and velocity graph
-scv.tl.velocity(adata)
-
-## Compute the (cosine) correlation of potential cell transitions with the velocity vector in high dimensional space
-scv.tl.velocity_graph(adata)
-
-## Project the velocity graph onto an embedding
-scv.tl.velocity_embedding(adata, basis='umap')
+## Preprocess the data, compute velocity and the (cosine) transition graph, and
+## project it onto the UMAP. Steps are cached by `velocity_pipeline.py`, keyed
+## on the merged data, so unchanged inputs load the stored results.
+adata.write_h5ad(config.data['TLS AnnData w/ spliced']['path'])
+adata = process_velocity(config.data['TLS AnnData w/ spliced']['path'])
 
 ## Plot results
 scv.pl.velocity_embedding_stream(adata, legend_loc='on data', alpha=.05, color='louvain')
@@ -14,6 +14,10 @@ import logging
 from rpy2.robjects import pandas2ri
 import anndata2ri
 
+from TLS.src.tls_utils.io import join_metadata, load_timepoints, read_10x_mtx, read_samples
+from TLS.src.tls_utils.qc import qc_filter
+from TLS.src.tls_utils.size_factors import normalize_size_factors
+
 rpy2.rinterface_lib.callbacks.logger.setLevel(logging.ERROR)
 
 pandas2ri.activate()
@@ -27,158 +31,37 @@ sc.logging.print_versions()
 get_ipython().run_cell_magic('R', '', '# Load all the R libraries we will be using in the notebook\nlibrary(scran)\nlibrary(RColorBrewer)\nlibrary(slingshot)\nlibrary(monocle)\nlibrary(gam)\nlibrary(clusterExperiment)\nlibrary(ggplot2)\nlibrary(plyr)\nlibrary(MAST)')
 
 
-# Read data
-data_file = 'TLS_120h/outs/filtered_feature_bc_matrix/matrix.mtx.gz'
-barcode_file = 'TLS_120h/outs/filtered_feature_bc_matrix/barcodes.tsv.gz'
-gene_file = 'TLS_120h/outs/filtered_feature_bc_matrix/features.tsv.gz'
-#Load data
-adata = sc.read(data_file, cache=True)
-adata = adata.transpose()
-adata.X = adata.X.toarray()
-barcodes = pd.read_csv(barcode_file, header=None, sep='\t')
-genes = pd.read_csv(gene_file, header=None, sep='\t')
-genes = genes.drop(2, axis=1)
-
-barcodes.rename(columns={0:'barcode'}, inplace=True)
-barcodes.set_index('barcode', inplace=True)
-adata.obs = barcodes
-adata.obs['sample'] = 'TLS_120h'
-adata.obs['region'] = 'TLS'
-adata.obs['donor'] = 'TLS'
-
-genes.rename(columns={0:'gene_id', 1:'gene_symbol'}, inplace=True)
-genes.set_index('gene_symbol', inplace=True)
-adata.var = genes
-
-meta = pd.read_csv('Cluster_TLS_120h.tsv', sep='\t')
-adata = adata[[i for i,x in enumerate(adata.obs.index) if x in np.array([meta['BC']])],]
-meta.set_index('BC', inplace=True)
-adata.obs['denovo_cluster'] = [meta['denovo']][0][adata.obs.index]
-adata.obs['TLS_cluster'] = [meta['TLS']][0][adata.obs.index]
-
-meta = pd.read_csv('UMAP_TLS_120h.tsv', sep='\t')
-adata = adata[[i for i,x in enumerate(adata.obs.index) if x in np.array([meta['BC']])],]
-meta.set_index('BC', inplace=True)
-adata.obs['UMAP1'] = [meta['UMAP_1']][0][adata.obs.index]
-adata.obs['UMAP2'] = [meta['UMAP_2']][0][adata.obs.index]
-
-sc.pp.filter_genes(adata, min_cells=3)
-
-TLS_120h = adata
-
-
-# Read data
-data_file = 'Gastruloid/outs/filtered_feature_bc_matrix/matrix.mtx.gz'
-barcode_file = 'Gastruloid/outs/filtered_feature_bc_matrix/barcodes.tsv.gz'
-gene_file = 'Gastruloid/outs/filtered_feature_bc_matrix/features.tsv.gz'
-
-adata = sc.read(data_file, cache=True)
-adata = adata.transpose()
-adata.X = adata.X.toarray()
-barcodes = pd.read_csv(barcode_file, header=None, sep='\t')
-genes = pd.read_csv(gene_file, header=None, sep='\t')
-genes = genes.drop(2, axis=1)
-
-barcodes.rename(columns={0:'barcode'}, inplace=True)
-barcodes.set_index('barcode', inplace=True)
-adata.obs = barcodes
-adata.obs['sample'] = 'Gastruloid'
-adata.obs['region'] = 'Gastruloid'
-adata.obs['donor'] = 'Gastruloid'
-
-genes.rename(columns={0:'gene_id', 1:'gene_symbol'}, inplace=True)
-genes.set_index('gene_symbol', inplace=True)
-adata.var = genes
-
-meta = pd.read_csv('Cluster_Gastruloid.tsv', sep='\t')
-adata = adata[[i for i,x in enumerate(adata.obs.index) if x in np.array([meta['BC']])],]
-meta.set_index('BC', inplace=True)
-adata.obs['denovo_cluster'] = [meta['denovo']][0][adata.obs.index]
-adata.obs['TLS_cluster'] = [meta['TLS']][0][adata.obs.index]
-
-meta = pd.read_csv('UMAP_Gastruloid.tsv', sep='\t')
-adata = adata[[i for i,x in enumerate(adata.obs.index) if x in np.array([meta['BC']])],]
-meta.set_index('BC', inplace=True)
-adata.obs['UMAP1'] = [meta['UMAP_1']][0][adata.obs.index]
-adata.obs['UMAP2'] = [meta['UMAP_2']][0][adata.obs.index]
-
-sc.pp.filter_genes(adata, min_cells=3)
-
-Gastruloid = adata
-
-
-
-# Load data
-data_file = 'TLSCL/outs/filtered_feature_bc_matrix/matrix.mtx.gz'
-barcode_file = 'TLSCL/outs/filtered_feature_bc_matrix/barcodes.tsv.gz'
-gene_file = 'TLSCL/outs/filtered_feature_bc_matrix/features.tsv.gz'
-
-adata = sc.read(data_file, cache=True)
-adata = adata.transpose()
-adata.X = adata.X.toarray()
-barcodes = pd.read_csv(barcode_file, header=None, sep='\t')
-genes = pd.read_csv(gene_file, header=None, sep='\t')
-genes = genes.drop(2, axis=1)
-
-barcodes.rename(columns={0:'barcode'}, inplace=True)
-barcodes.set_index('barcode', inplace=True)
-adata.obs = barcodes
-adata.obs['sample'] = 'TLSCL'
-adata.obs['region'] = 'TLSCL'
-adata.obs['donor'] = 'TLSCL'
-
-genes.rename(columns={0:'gene_id', 1:'gene_symbol'}, inplace=True)
-genes.set_index('gene_symbol', inplace=True)
-adata.var = genes
-
-meta = pd.read_csv('Cluster_TLSCL.tsv', sep='\t')
-adata = adata[[i for i,x in enumerate(adata.obs.index) if x in np.array([meta['BC']])],]
-meta.set_index('BC', inplace=True)
-adata.obs['denovo_cluster'] = [meta['denovo']][0][adata.obs.index]
-adata.obs['TLS_cluster'] = [meta['TLS']][0][adata.obs.index]
-
-meta = pd.read_csv('UMAP_TLSCL.tsv', sep='\t')
-adata = adata[[i for i,x in enumerate(adata.obs.index) if x in np.array([meta['BC']])],]
-meta.set_index('BC', inplace=True)
-adata.obs['UMAP1'] = [meta['UMAP_1']][0][adata.obs.index]
-adata.obs['UMAP2'] = [meta['UMAP_2']][0][adata.obs.index]
-
-sc.pp.filter_genes(adata, min_cells=3)
-
-TLSCL = adata
-
-
-
-# Concatenate to main adata object
-adata = TLS_120h.concatenate(Gastruloid, batch_key='sample')
-adata.var['gene_id'] = adata.var['gene_id-1']
-adata.var.drop(columns = ['gene_id-1', 'gene_id-0'], inplace=True)
-adata.obs_names = [c.split("-")[0] for c in adata.obs_names]
-adata.obs_names_make_unique(join='_')
-adata.var_names_make_unique()
-adata.obs_names_make_unique()
-
-adata = adata.concatenate(TLSCL, batch_key='sample')
-adata.var['gene_id'] = adata.var['gene_id-1']
-adata.var.drop(columns = ['gene_id-1', 'gene_id-0'], inplace=True)
-adata.obs_names = [c.split("-")[0] for c in adata.obs_names]
-adata.obs_names_make_unique(join='_')
-adata.var_names_make_unique()
-adata.obs_names_make_unique()
+# Load data (sparse)
+def read_sample(name, region, donor):
+    adata = read_10x_mtx(f'{name}/outs/filtered_feature_bc_matrix',
+                         obs=dict(sample=name, region=region, donor=donor))
+
+    adata = join_metadata(adata,
+                          (f'Cluster_{name}.tsv', {'denovo': 'denovo_cluster', 'TLS': 'TLS_cluster'}),
+                          (f'UMAP_{name}.tsv', {'UMAP_1': 'UMAP1', 'UMAP_2': 'UMAP2'}))
+
+    sc.pp.filter_genes(adata, min_cells=3)
 
+    return adata
+
+
+# Load samples concurrently and concatenate to main adata object in one pass
+adata = load_timepoints(
+    {
+        'TLS_120h': dict(region='TLS', donor='TLS'),
+        'Gastruloid': dict(region='Gastruloid', donor='Gastruloid'),
+        'TLSCL': dict(region='TLSCL', donor='TLSCL'),
+    },
+    read=read_sample,
+)
 adata.obs['sample'] = adata.obs['donor']
-adata.var_names_make_unique()
-adata.obs_names_make_unique()
 
 
 
 
 # Pre-processing and visualization
-adata.obs['n_counts'] = adata.X.sum(1)
-adata.obs['log_counts'] = np.log(adata.obs['n_counts'])
-adata.obs['n_genes'] = (adata.X > 0).sum(1)
-mt_gene_mask = [gene.startswith('mt-') for gene in adata.var_names]
-adata.obs['mt_frac'] = adata.X[:, mt_gene_mask].sum(1)/adata.obs['n_counts']
+# QC metrics in one pass (no filtering)
+adata = qc_filter(adata, mt_prefix='mt-')
 
 # Normalization
 adata_pp = adata.copy()
@@ -187,16 +70,17 @@ sc.pp.log1p(adata_pp)
 sc.pp.pca(adata_pp, n_comps=15)
 sc.pp.neighbors(adata_pp)
 sc.tl.louvain(adata_pp, key_added='groups', resolution=1)
+# Pooled size factors from scran itself: the native port (`size_factors.pooled_size_factors`)
+# replaces this once `bench_size_factors.py --check` passes against stored scran output
 input_groups = adata_pp.obs['groups']
 data_mat = adata.X.T
 get_ipython().run_cell_magic('R', '-i data_mat -i input_groups -o size_factors', '\nsize_factors = computeSumFactors(data_mat, clusters=input_groups, min.mean=0.1)')
 del adata_pp
 
 adata.obs['size_factors'] = size_factors
-adata.layers["counts"] = adata.X.copy()
-adata.X /= adata.obs['size_factors'].values[:,None]
-sc.pp.log1p(adata)
-adata.raw = adata
+
+# Scale and log the non-zeros in place; counts and raw share the matrix structure
+normalize_size_factors(adata, counts_layer='counts', raw=True)
 adata.obsm['X_umap'] = np.array(adata.obs[['UMAP1','UMAP2']])
 
 
@@ -265,11 +149,13 @@ Gastruloid = adata[adata.obs['donor'].isin(['Gastruloid'])]
 TLSCL = adata[adata.obs['donor'].isin(['TLSCL'])]
 
 # Read and merge velocity
-TLS_loom_120 = scv.read("TLS_120h/velocyto/TLS_120h.loom", sparse=True, cache=True)
+TLS_loom_120, Gastruloid_loom_120, TLSCL_loom_120 = read_samples(
+    {path: dict(sparse=True, cache=True) for path in
+     ["TLS_120h/velocyto/TLS_120h.loom", "Gastruloid/velocyto/Gastruloid.loom", "TLSCL/velocyto/TLSCL.loom"]},
+    read=scv.read,
+)
 TLS_loom_120.var_names_make_unique()
-Gastruloid_loom_120 = scv.read("Gastruloid/velocyto/Gastruloid.loom", sparse=True, cache=True)
 Gastruloid_loom_120.var_names_make_unique()
-TLSCL_loom_120 = scv.read("TLSCL/velocyto/TLSCL.loom", sparse=True, cache=True)
 TLSCL_loom_120.var_names_make_unique()
 
 ## merge loom file into an already existing object
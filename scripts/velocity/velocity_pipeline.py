@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+RNA velocity of the three-timepoint TLS data, with stored artifacts.
+
+Runs scvelo's normalisation, moments, velocity, transition graph and
+embedding on the preprocessed data merged with the looms (written by
+`velocity.py`), checkpointing the moments and the graph (with the velocity
+layers). Keys derive from the input file, each step's parameters and the
+scvelo version, so a re-run only computes what changed, and the plots
+(`plot_velocity.py`) open the stored result.
+
+Usage:
+    python TLS/scripts/velocity/velocity_pipeline.py
+    python TLS/scripts/velocity/velocity_pipeline.py --data merged.h5ad --output velocity.h5ad
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import scvelo as scv
+
+from TLS.configs.config_manager import config
+from TLS.src.tls_utils import ignore_warnings
+from TLS.src.tls_utils.pipeline import CachedPipeline, Step
+from TLS.src.tls_utils.velocity_graph import velocity_graph
+
+
+VELOCITY_STEPS = [
+    Step(scv.pp.filter_and_normalize, dict(min_counts=20, min_counts_u=10, n_top_genes=3000)),
+    Step(scv.pp.moments, dict(n_pcs=50, n_neighbors=30), checkpoint=True),  # Ms, Mu
+    Step(scv.tl.velocity),  # velocity layers
+    Step(velocity_graph, checkpoint=True),  # transition graph (blocked, parallel port of scv.tl.velocity_graph)
+    Step(scv.tl.velocity_embedding, dict(basis='umap')),
+]
+VELOCITY_VERSION = f'scvelo-{scv.__version__}'
+
+
+def process_velocity(path=config.data['TLS AnnData w/ spliced']['path'],
+                     cache_dir=config.data['TLS velocity cache']['path']):
+    """
+    Velocity of the merged spliced/unspliced data (`VELOCITY_STEPS`).
+
+    Results of each checkpointed step are cached on disk, keyed on the
+    input file, the steps' parameters and the scvelo version.
+    """
+    pipeline = CachedPipeline(VELOCITY_STEPS, cache_dir, version=VELOCITY_VERSION)
+    return pipeline.run(path, backed=None)._obj
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str,
+                        default=config.data['TLS AnnData w/ spliced']['path'],
+                        help='Preprocessed data merged with the looms')
+    parser.add_argument('--cache-dir', type=str,
+                        default=config.data['TLS velocity cache']['path'])
+    parser.add_argument('--output', type=str,
+                        default=config.data['TLS AnnData w/ velocity']['path'],
+                        help='Where to write the data with velocity')
+
+    args = parser.parse_args()
+
+    return vars(args)
+
+
+if __name__ == '__main__':
+    ignore_warnings()
+    args = parse_args()
+
+    adata = process_velocity(args['data'], cache_dir=args['cache_dir'])
+
+    output = Path(args['output'])
+    output.parent.mkdir(parents=True, exist_ok=True)
+    adata.write_h5ad(output.with_suffix('.h5ad.tmp'))
+    os.replace(output.with_suffix('.h5ad.tmp'), output)
@@ -1,15 +1,102 @@
 from abc import ABC
+from contextlib import contextmanager
+from copy import deepcopy
 import datetime
+from functools import cached_property
+from io import BytesIO
 from pathlib import Path
 import types
-from typing import Dict, List, Union
+from typing import Callable, Dict, Iterator, List, Tuple, Union
 
 import matplotlib.pyplot as plt
 from matplotlib.axes import Axes
 from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
 import numpy as np
 import pandas as pd
 import scanpy as sc
+from scanpy.plotting._utils import (
+    _set_colors_for_categorical_obs,
+    _set_default_colors_for_categorical_obs,
+)
+from scipy import sparse
+
+from TLS.src.tls_utils import preprocessing
+from TLS.src.tls_utils.gene_store import GeneStore
+from TLS.src.tls_utils.hashing import fingerprint
+from TLS.src.tls_utils.obs_index import ObsIndex
+from TLS.src.tls_utils.pagapath import PagaPath, save_frame
+from TLS.src.tls_utils.rendering import EmbeddingRenderer, render_cache
+from TLS.src.tls_utils.step_memo import StepMemo, step_memo
+
+
+def _category_colors(obs: pd.DataFrame, key: str, palette=None) -> np.ndarray:
+    """Scanpy's colours for the categories of `obs[key]`, without writing them to `uns`."""
+    scratch = sc.AnnData(obs=obs[[key]])
+    if palette is not None:
+        _set_colors_for_categorical_obs(scratch, key, palette)
+    else:
+        _set_default_colors_for_categorical_obs(scratch, key)
+    return np.asarray(scratch.uns[f'{key}_colors'])
+
+
+def _to_memory(adata: sc.AnnData) -> sc.AnnData:
+    # Backed objects (and their views) can't be `.copy()`-ed without a filename
+    return adata.to_memory() if adata.isbacked else adata.copy()
+
+
+def _with_own_annotations(adata: sc.AnnData) -> sc.AnnData:
+    """`adata` with its own annotations (obs, var, uns, ...); the matrices are shared, not copied."""
+    if adata.isbacked:
+        return adata.to_memory()
+    copied = sc.AnnData(
+        X=adata.X,
+        obs=adata.obs.copy(),
+        var=adata.var.copy(),
+        uns=deepcopy(dict(adata.uns)),
+        obsm=dict(adata.obsm),
+        varm=dict(adata.varm),
+        obsp=dict(adata.obsp),
+        varp=dict(adata.varp),
+        layers=dict(adata.layers),
+    )
+    if adata.raw is not None:
+        copied.raw = sc.AnnData(X=adata.raw.X, obs=pd.DataFrame(index=copied.obs_names), var=adata.raw.var.copy())
+    return copied
+
+
+def _writeable(adata: sc.AnnData) -> bool:
+    """Whether in-place methods can modify the matrices of `adata` (not backed or read-only mapped)."""
+    if adata.isbacked:
+        return False
+    matrices = [adata.X, *adata.layers.values()] + ([adata.raw.X] if adata.raw is not None else [])
+    return all(
+        (matrix.data if sparse.issparse(matrix) else np.asarray(matrix)).flags.writeable
+        for matrix in matrices if matrix is not None
+    )
+
+
+class CachedAccessor:
+    """
+    Descriptor that builds an accessor once per `AnnData` object.
+
+    The accessor is stored in the instance `__dict__` under the accessor's
+    name, so every access after the first one is a plain attribute lookup.
+    `AnnData` objects are unhashable (and the accessor holds a reference to
+    its object), so a weak-keyed cache is not an option here.
+    """
+
+    def __init__(self, name, accessor):
+        self._name = name
+        self._accessor = accessor
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self._accessor
+
+        accessor_obj = self._accessor(obj)
+        object.__setattr__(obj, self._name, accessor_obj)
+        return accessor_obj
 
 
 def register_anndata_accessor(name):
@@ -17,57 +104,114 @@ def register_anndata_accessor(name):
         if hasattr(sc.AnnData, name):
             # raise AttributeError(f"Accessor {name} already exists in scanpy's AnnData.")
             pass
-        setattr(sc.AnnData, name, property(lambda self: cls(self)))
+        setattr(sc.AnnData, name, CachedAccessor(name, cls))
         return cls
     return decorator
 
 
 class BaseAnnDataMixin(ABC):
+    """
+    Resolves scanpy functions as chainable accessor methods.
+
+    Each mixin names a scanpy module (`_module`) and the functions to skip
+    (`_exclude`). The dispatch table is built once per class, when the class
+    is created; mixins later in the MRO are overridden by earlier ones, so
+    `sc.pp` takes precedence over `sc.tl`, which takes precedence over `sc.pl`.
+    Wrappers are only built when a method is first looked up on an instance.
+
+    Mixins whose functions only read the data (plotting) set `_inplace` to
+    False, which lets lazy accessors hand them a view instead of a copy.
+    Functions that modify the data can be memoised by setting `_memo` to a
+    `StepMemo`.
+    """
+
+    _module = None
+    _exclude = []
+    _inplace = True
+    _dispatch = {}
+    _memo = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = cls.build_dispatch()
 
-    def build_methods(self, module, exclude=None):
-        for name, func in module.__dict__.items():
-            if (
-                callable(func)
-                and not name.startswith("_")
-                and (exclude is None or name not in exclude)
-            ):
-                setattr(self, name, types.MethodType(self._make_func(func), self))
-
-    def _make_func(self, func):
+    @classmethod
+    def build_dispatch(cls) -> Dict[str, Tuple[Callable, bool]]:
+        dispatch = {}
+        for klass in reversed(cls.__mro__):
+            module = klass.__dict__.get('_module')
+            if module is None:
+                continue
+
+            exclude = klass.__dict__.get('_exclude') or []
+            inplace = klass.__dict__.get('_inplace', True)
+            for name, func in module.__dict__.items():
+                if (
+                    callable(func)
+                    and not name.startswith("_")
+                    and name not in exclude
+                ):
+                    dispatch[name] = (func, inplace)
+
+        return dispatch
+
+    def __getattr__(self, name):
+        try:
+            func, inplace = type(self)._dispatch[name]
+        except KeyError:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+            ) from None
+
+        # Cache the bound wrapper so `__getattr__` is only hit once per name
+        method = types.MethodType(self._make_func(func, inplace=inplace), self)
+        self.__dict__[name] = method
+        return method
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(type(self)._dispatch))
+
+    def _make_func(self, func, inplace=True):
         def wrapper(*__, **kwargs):
+            if inplace:
+                # Functions that only read annotations don't need writeable matrices
+                self._materialize(matrices=func.__name__ not in StepMemo._skip_X)
+                if self._memo is not None:
+                    self._memo.call(func, self._obj, kwargs)
+                    return self
+            else:
+                with self._readonly(kwargs) as kwargs:
+                    func(self._obj, **kwargs)
+                return self
             func(self._obj, **kwargs)
             return self
         return wrapper
 
+    def _materialize(self, matrices: bool = True) -> None:
+        pass
+
+    @contextmanager
+    def _readonly(self, kwargs: Dict) -> Iterator[Dict]:
+        yield kwargs
+
 
 class ScanpyPreprocessMixin(BaseAnnDataMixin):
     
-    _scpp_module = sc.pp
-    _scpp_exclude = []
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.build_methods(module=self._scpp_module, exclude=self._scpp_exclude)
+    _module = sc.pp
+    _exclude = []
 
 
 class ScanpyToolsMixin(BaseAnnDataMixin):
     
-    _sctl_module = sc.tl
-    _sctl_exclude = ['pca', 'tsne', 'umap', 'diffmap', 'draw_graph']
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.build_methods(module=self._sctl_module, exclude=self._sctl_exclude)
+    _module = sc.tl
+    _exclude = ['pca', 'tsne', 'umap', 'diffmap', 'draw_graph']
 
 
 class ScanpyPlottingMixin(BaseAnnDataMixin):
     
-    _scpl_module = sc.pl
-    _scpl_exclude = ['paga', 'louvain', 'dpt']
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.build_methods(module=self._scpl_module, exclude=self._scpl_exclude)
+    _module = sc.pl
+    _exclude = ['paga', 'louvain', 'dpt']
+    _inplace = False
 
         
 @register_anndata_accessor("tls")
@@ -76,19 +220,220 @@ class TLSAnnDataAccessor(
     ScanpyToolsMixin,
     ScanpyPlottingMixin,
 ):
-    def __init__(self, anndata_obj: sc.AnnData):
-        self._obj = anndata_obj
+    """
+    Chainable scanpy methods and TLS-specific queries on an `AnnData` object.
+
+    By default, every query returns an accessor on a filtered copy. In lazy
+    mode (see `lazy`), queries only compose an integer index into the
+    original object: plotting methods receive an `AnnData` view, and the
+    selection is copied once, the first time a method modifies the data.
+
+    Compound selections (`query`) are answered from an `ObsIndex` over the
+    timepoint and cluster columns, shared by all lazy accessors on the same
+    object and rebuilt when `obs` changes.
+    """
+
+    _indexed_keys = ['donor', 'louvain', 'louvain2', 'louvain_sub']
+
+    def __init__(
+        self,
+        anndata_obj: sc.AnnData,
+        lazy: bool = False,
+        index: np.ndarray = None,
+    ):
+        self._base = anndata_obj
+        self._index = index
+        self._lazy = lazy
+        self._query_memo = {}
+        # Shared (by reference) with the lazy accessors derived from this one
+        self._obs_index_ref = [None]
+        self._renderer_ref = [None]
+        self._gene_store = None
+        self._gene_store_rows = (None, None)
+        self._own_annotations = False
         super().__init__()
-        self._get_timepoints()
+
+    @property
+    def _obj(self) -> sc.AnnData:
+        if self._index is None:
+            return self._base
+        return self._base[self._index]
+
+    def _materialize(self, matrices: bool = True) -> None:
+        """
+        Copy a pending selection, or (if `matrices` are to be modified)
+        read-only data, e.g., a `DatasetStore` or a backed file, so it can
+        be modified in place.
+
+        The accessor then works on its own copy; the object it was created
+        from is left as it was. Annotation-only methods on read-only data
+        copy just the annotations (obs, uns, ...), sharing the matrices.
+
+        Notes
+        -----
+        - The copy replaces the accessor's data, not the object, so
+          `adata.tls` on a shared object (e.g., `tls_120h_dataset()`) is
+          still shared with every thread using it; take `adata.tls.lazy()`
+          per session.
+        - Copies drop the `dataset_store` identity: their renders are no
+          longer those of the stored data, so they are not cached.
+        """
+        if self._index is not None or (matrices and not _writeable(self._base)):
+            self._base = _to_memory(self._obj)
+        elif not (self._own_annotations or _writeable(self._base)):
+            self._base = _with_own_annotations(self._base)
+        else:
+            return
+        self._base.uns.pop('dataset_store', None)
+        self._index = None
+        self._own_annotations = True
+        self._obs_index_ref = [None]
+        self._renderer_ref = [None]
+
+    @contextmanager
+    def _readonly(self, kwargs: Dict) -> Iterator[Dict]:
+        """
+        Set categorical colours on the full object while plotting a view.
+
+        Scanpy writes default (or `palette`) colours into `uns`, which makes
+        a view copy itself, and fails for backed objects. Colours set on the
+        full object are inherited by the view, so nothing is written to it.
+
+        The previous colours are restored afterwards when plotting a view or
+        shared, read-only data (a `DatasetStore` or a backed file), so
+        plotting never changes those objects. Plotting the whole of an
+        in-memory object keeps scanpy's colours in its `uns`.
+        """
+        color = kwargs.get('color')
+        keys = [color] if isinstance(color, str) else list(color or [])
+        keys = [
+            key for key in keys
+            if key in self._base.obs and self._base.obs[key].dtype.name == 'category'
+        ]
+        restore = self._index is not None or not (self._own_annotations or _writeable(self._base))
+        saved = {f'{key}_colors': self._base.uns.get(f'{key}_colors') for key in keys} if restore else {}
+
+        try:
+            if self._index is not None:
+                palette = kwargs.pop('palette', None)
+                for key in keys:
+                    colors = saved[f'{key}_colors']
+                    if palette is not None or colors is None or len(colors) < len(self._base.obs[key].cat.categories):
+                        self._base.uns[f'{key}_colors'] = _category_colors(self._base.obs, key, palette)
+            yield kwargs
+        finally:
+            for uns_key, colors in saved.items():
+                if colors is None:
+                    self._base.uns.pop(uns_key, None)
+                else:
+                    self._base.uns[uns_key] = colors
+
+    def _obs_values(self, key: str) -> Union[np.ndarray, pd.Categorical]:
+        values = self._base.obs[key].values
+        return values if self._index is None else values[self._index]
+
+    def _subset(self, mask: np.ndarray) -> 'TLSAnnDataAccessor':
+        index = np.flatnonzero(mask)
+        if self._index is not None:
+            index = self._index[index]
+        return self._take(index)
+
+    def _take(self, index: np.ndarray) -> 'TLSAnnDataAccessor':
+        # `index` holds positions in `self._base`
+        if not self._lazy:
+            taken = type(self)(_to_memory(self._base[index]))
+            taken._gene_store = self._gene_store
+            taken._memo = self._memo
+            return taken
+        return self._derive(index)
+
+    def _derive(self, index: np.ndarray) -> 'TLSAnnDataAccessor':
+        derived = type(self)(self._base, lazy=True, index=index)
+        derived._obs_index_ref = self._obs_index_ref
+        derived._renderer_ref = self._renderer_ref
+        derived._gene_store = self._gene_store
+        derived._memo = self._memo
+        return derived
+
+    def lazy(self) -> 'TLSAnnDataAccessor':
+        """Return an accessor whose queries defer copying the data."""
+        return self._derive(self._index)
+
+    def memoize(self, memo: StepMemo = None) -> 'TLSAnnDataAccessor':
+        """
+        Memoise scanpy calls on this accessor and those derived from it.
+
+        Repeated calls with the same arguments on the same data (e.g., the
+        same `.paga(groups='louvain')` in several scripts) replay the
+        recorded annotations. Uses the shared `step_memo` by default.
+        """
+        self._memo = step_memo if memo is None else memo
+        return self
+
+    @property
+    def obs_index(self) -> ObsIndex:
+        obs_index = self._obs_index_ref[0]
+        if obs_index is None or obs_index.is_stale(self._base.obs):
+            obs_index = ObsIndex(self._base.obs, keys=self._indexed_keys)
+            self._obs_index_ref[0] = obs_index
+        return obs_index
+
+    @property
+    def renderer(self) -> EmbeddingRenderer:
+        """Rasteriser for the UMAP of the full (unselected) object."""
+        if self._renderer_ref[0] is None:
+            self._renderer_ref[0] = EmbeddingRenderer(self._base.obsm['X_umap'])
+        return self._renderer_ref[0]
+
+    # --- Gene lookups ---
+
+    def attach_gene_store(self, path: Union[str, Path] = None) -> 'TLSAnnDataAccessor':
+        """
+        Read single genes from a `GeneStore` instead of the expression matrix.
+
+        Defaults to the store next to the object's backing file.
+        """
+        if path is None:
+            path = GeneStore.default_path(self._base.filename)
+        self._gene_store = GeneStore(path)
+        return self
+
+    @property
+    def gene_store(self) -> GeneStore:
+        return self._gene_store
+
+    def gene_values(self, gene: str) -> np.ndarray:
+        """Expression of `gene` in the selected cells (`.raw` if present)."""
+        if self._gene_store is None:
+            obj = self._obj
+            return (obj.raw if obj.raw is not None else obj).obs_vector(gene)
+
+        # Store rows are matched to `obs_names` once per underlying object
+        obs_names, rows = self._gene_store_rows
+        if obs_names is not self._base.obs_names:
+            obs_names = self._base.obs_names
+            rows = pd.Index(self._gene_store.obs_names).get_indexer(obs_names)
+            if (rows < 0).any():
+                raise ValueError('Cells are missing from the gene store')
+            self._gene_store_rows = (obs_names, rows)
+
+        if self._index is not None:
+            rows = rows[self._index]
+        return self._gene_store.get(gene)[rows]
 
     @property
     def timepoints(self) -> np.ndarray:
         return self._obj.obs['donor'].cat.categories.values
 
-    def _get_timepoints(self) -> None:
+    @property
+    def timepoints_cat(self) -> np.ndarray:
         # TODO: Temporary...
-        self.timepoints_cat = self.timepoints
-        self.timepoints_dt = (
+        return self.timepoints
+
+    @cached_property
+    def timepoints_dt(self) -> np.ndarray:
+        # Parsed on first use rather than on every accessor construction
+        return (
             pd.Series(self.timepoints_cat)
             .str.split('_', expand=True).get(1)
             .str.split('h', expand=True).get(0)
@@ -98,19 +443,46 @@ class TLSAnnDataAccessor(
         
     def set_raw(self, raw) -> None:
         # TODO: Unclear what this is doing...
+        self._materialize(matrices=False)
         self._obj.raw = raw
         return self
 
     # --- Query methods ---
     # TODO: Refactor exclude and query methods into a more general method
+    # NOTE: Accessors are cached on their `AnnData` object, so query methods
+    #   return a new accessor instead of swapping out `self._obj`.
     
     def exclude_clusters(self, method: str, cluster_ids: List[str]) -> None:
-        self._obj = self._obj[~self._obj.obs[method].isin(cluster_ids)].copy()
-        return self
+        return self._subset(~pd.Series(self._obs_values(method)).isin(cluster_ids).values)
 
     def query_clusters(self, method: str, cluster_ids: List[str]) -> None:
         return self._query(cluster_ids, method)
 
+    def query(
+        self,
+        include: Dict[str, List] = None,
+        exclude: Dict[str, List] = None,
+    ) -> 'TLSAnnDataAccessor':
+        """
+        Select cells by several `obs` columns at once.
+
+        Parameters
+        ----------
+        include
+            Maps `obs` columns to the values to keep. Values of one column
+            are OR-ed, columns are AND-ed. `None` values are ignored.
+        exclude
+            Maps `obs` columns to the values to drop.
+        """
+        include = {k: v for k, v in (include or {}).items() if v is not None and v != [None]}
+        exclude = {k: v for k, v in (exclude or {}).items() if v is not None}
+        if len(include) == 0 and len(exclude) == 0:
+            return self
+
+        # Values are validated against the selected cells, as in `_isin`
+        index = self.obs_index.select(include=include, exclude=exclude, within=self._index)
+        return self._take(index)
+
     def query_timepoints(self, timepoints: List[str]) -> None:
         _timepoint_key = 'donor'
         return self._query(timepoints, _timepoint_key)
@@ -120,16 +492,43 @@ class TLSAnnDataAccessor(
             return self
 
         else:
-            if key not in self._obj.obs.keys():
-                raise ValueError(f'Invalid key: {key}')
-            
-            for value in values:
-                if value not in self._obj.obs[key].values:
-                    raise ValueError(f'Invalid {key}: {value}')
+            return self._subset(self._isin(key, values))
 
-            self._obj = self._obj[np.in1d(self._obj.obs[key], values)].copy()
+    def _isin(self, key: str, values: List) -> np.ndarray:
+        """
+        Boolean mask of the selected cells whose `obs[key]` is in `values`.
 
-            return self
+        Validation and masking run on the categorical codes, and masks are
+        memoised per `(key, values)` until the column or selection changes.
+        """
+        if key not in self._base.obs.keys():
+            raise ValueError(f'Invalid key: {key}')
+
+        column = self._base.obs[key].values
+        memo_key = (key, tuple(values))
+        memo = self._query_memo.get(memo_key)
+        if memo is not None and memo[0] is column and memo[1] is self._index:
+            return memo[2]
+
+        obs_values = self._obs_values(key)
+        if not isinstance(obs_values, pd.Categorical):
+            obs_values = pd.Categorical(obs_values)
+        categories, codes = obs_values.categories, obs_values.codes
+
+        # Requested values must be categories with at least one selected cell
+        value_codes = categories.get_indexer(list(values))
+        observed = np.bincount(codes[codes >= 0], minlength=len(categories)) > 0
+        invalid = (value_codes < 0) | ~observed[value_codes]
+        if invalid.any():
+            raise ValueError(f'Invalid {key}: {list(values)[np.flatnonzero(invalid)[0]]}')
+
+        # Missing values have code -1, which indexes the trailing `False`
+        lookup = np.zeros(len(categories) + 1, dtype=bool)
+        lookup[value_codes] = True
+        mask = lookup[codes]
+
+        self._query_memo[memo_key] = (column, self._index, mask)
+        return mask
     
     # --- Assign methods ---
     
@@ -140,9 +539,61 @@ class TLSAnnDataAccessor(
         return self._assign('obs', **kwargs)
 
     def _assign(self, ad_attr, key, value_func) -> None:
+        self._materialize(matrices=False)
         getattr(self._obj, ad_attr)[key] = value_func(self._obj)
         return self
 
+    # --- Batched replacements for `sc.pp` methods ---
+    # Arguments the batched versions don't take (e.g., `layer` or `copy`)
+    # are passed on to the `sc.pp` function instead, as for mix-in methods
+
+    @staticmethod
+    def _any_set(kwargs: Dict) -> bool:
+        # Arguments left at scanpy's defaults (None or False) can be ignored
+        return any(value is not None and value is not False for value in kwargs.values())
+
+    def regress_out(
+        self,
+        keys: Union[str, List[str]],
+        block_size: int = 2000,
+        max_workers: int = None,
+        n_jobs: int = None,
+        **kwargs,
+    ) -> None:
+        """
+        `sc.pp.regress_out`, solved for all genes at once (see `preprocessing.regress_out`).
+
+        `n_jobs` is used as `max_workers`; with any other `sc.pp.regress_out`
+        argument, `sc.pp.regress_out` is run instead.
+        """
+        if self._any_set(kwargs):
+            return self._make_func(sc.pp.regress_out)(keys=keys, n_jobs=n_jobs, **kwargs)
+        self._materialize()
+        preprocessing.regress_out(self._obj, keys, block_size=block_size,
+                                  max_workers=n_jobs if max_workers is None else max_workers)
+        return self
+
+    def scale(
+        self,
+        zero_center: bool = True,
+        max_value: float = None,
+        block_size: int = 2000,
+        max_workers: int = None,
+        **kwargs,
+    ) -> None:
+        """
+        `sc.pp.scale`, in blocks of cells on a thread pool (see `preprocessing.scale`).
+
+        With any other `sc.pp.scale` argument (e.g., `layer`, `obsm`,
+        `mask_obs` or `copy`), `sc.pp.scale` is run instead.
+        """
+        if self._any_set(kwargs):
+            return self._make_func(sc.pp.scale)(zero_center=zero_center, max_value=max_value, **kwargs)
+        self._materialize()
+        preprocessing.scale(self._obj, zero_center=zero_center, max_value=max_value,
+                            block_size=block_size, max_workers=max_workers)
+        return self
+
     # --- Methods that combine mix-in methods ---
 
     def umap_timepoint(
@@ -151,14 +602,143 @@ class TLSAnnDataAccessor(
         exclude: List[str] = None,
         ax: Axes = None,
         plot_kwargs: Dict = {},
+        raster: bool = False,
     ) -> None:
+        if raster:
+            return self._umap_timepoint_raster(timepoint, exclude, ax, plot_kwargs)
+
+        # Plotting only reads the data, so filter through views
         return (
             self
-            .query_timepoints(timepoints=[timepoint])
-            .exclude_clusters(method='louvain', cluster_ids=exclude)
+            .lazy()
+            .query(include={'donor': [timepoint]}, exclude={'louvain': exclude})
             .umap(color=['louvain'], palette=sc.pl.palettes.vega_20, show=False, ax=ax, **plot_kwargs)
         )
 
+    def _umap_timepoint_raster(self, timepoint, exclude, ax, plot_kwargs) -> None:
+        # Draws the cached image from `render_timepoint`, with a scanpy-like legend
+        ax = plt.gca() if ax is None else ax
+        ax.imshow(
+            EmbeddingRenderer.from_png(self.render_timepoint(timepoint, exclude)),
+            extent=self.renderer.bounds,
+            aspect='auto',
+        )
+        ax.set(xticks=[], yticks=[], xlabel='UMAP1', ylabel='UMAP2', title='louvain')
+
+        categories = self._base.obs['louvain'].cat.categories
+        colors = _category_colors(self._base.obs, 'louvain', sc.pl.palettes.vega_20)
+        present = set(self._select(timepoint, exclude)._obs_values('louvain').unique())
+        handles = [
+            Line2D([], [], marker='o', linestyle='', color=color, label=category)
+            for category, color in zip(categories, colors)
+            if category in present
+        ]
+        ax.legend(
+            handles=handles,
+            loc='center left',
+            bbox_to_anchor=(1, 0.5),
+            frameon=False,
+            fontsize=plot_kwargs.get('legend_fontsize'),
+        )
+        return self
+
+    def umap_gene(
+        self,
+        gene: str,
+        ax: Axes = None,
+        plot_kwargs: Dict = {},
+    ) -> None:
+        """
+        Plot the UMAP coloured by one gene.
+
+        Only the embedding and the gene's values are handed to scanpy, so
+        with a gene store attached the expression matrix is never read.
+        """
+        obj = self._obj
+        plot_adata = sc.AnnData(
+            obs=pd.DataFrame({gene: self.gene_values(gene)}, index=obj.obs_names),
+            obsm={'X_umap': np.asarray(obj.obsm['X_umap'])},
+        )
+        sc.pl.umap(plot_adata, color=gene, show=False, ax=ax, **plot_kwargs)
+        return self
+
+    # --- Rendered (rasterised) embeddings ---
+
+    def _render_key(self, *parts) -> Union[tuple, None]:
+        """
+        Key of a render in `render_cache`, or None (not cached) for data
+        without a stable identity.
+
+        Stored data is keyed on its version and backed data on its file;
+        in-memory objects are not cached, as their ids are reused.
+        """
+        if 'dataset_store' in self._base.uns:
+            dataset = self._base.uns['dataset_store']['version']
+        elif self._base.isbacked:
+            dataset = (str(self._base.filename), Path(self._base.filename).stat().st_mtime_ns)
+        else:
+            return None
+        return (dataset, *parts)
+
+    def _cached_render(self, render: Callable[[], bytes], *parts) -> bytes:
+        """`render()`, cached by `_render_key(*parts)`; on disk only for stored data, whose keys all processes share."""
+        return render_cache.get_or_render(self._render_key(*parts), render,
+                                          persist='dataset_store' in self._base.uns)
+
+    def _select(self, timepoint: str = None, exclude: List[str] = None) -> 'TLSAnnDataAccessor':
+        return self.lazy().query(include={'donor': [timepoint]}, exclude={'louvain': exclude})
+
+    def render_gene(
+        self,
+        gene: str,
+        timepoint: str = None,
+        exclude: List[str] = None,
+        cmap: str = 'viridis',
+    ) -> bytes:
+        """
+        PNG of the UMAP coloured by one gene, with a colour bar (labelled
+        with the minimum and maximum expression) below.
+
+        Images are cached in `render_cache` by (dataset, gene, timepoint,
+        excluded clusters).
+        """
+        def render():
+            selection = self._select(timepoint, exclude)
+            values = selection.gene_values(gene)
+            vmin, vmax = float(np.nanmin(values)), float(np.nanmax(values))
+            rgba = self.renderer.render_values(
+                values, cells=selection._index, cmap=cmap, vmin=vmin, vmax=vmax)
+            return EmbeddingRenderer.to_png(EmbeddingRenderer.colorbar(rgba, cmap=cmap, vmin=vmin, vmax=vmax))
+
+        return self._cached_render(render, 'gene', gene, timepoint, tuple(exclude or ()), cmap)
+
+    def render_timepoint(
+        self,
+        timepoint: str = None,
+        exclude: List[str] = None,
+    ) -> bytes:
+        """PNG of the UMAP coloured by `louvain` (see `umap_timepoint`)."""
+        def render():
+            selection = self._select(timepoint, exclude)
+            rgba = self.renderer.render_categories(
+                selection._obs_values('louvain').codes,
+                palette=_category_colors(self._base.obs, 'louvain', sc.pl.palettes.vega_20),
+                cells=selection._index,
+            )
+            return EmbeddingRenderer.to_png(rgba)
+
+        return self._cached_render(render, 'louvain', timepoint, tuple(exclude or ()))
+
+    _pagapath_params = ['groups_key', 'use_raw', 'n_avg', 'annotations']
+
+    def pagapath(self, nodes: List[str], **kwargs) -> PagaPath:
+        """
+        Cells along the PAGA path through `nodes`, ordered by pseudotime.
+
+        Keyword arguments are passed to `PagaPath`.
+        """
+        return PagaPath(self._obj, nodes, **kwargs)
+
     def pagapath_hmap(
         self,
         nodes: List[str],
@@ -168,21 +748,63 @@ class TLSAnnDataAccessor(
         save_df: bool = False,
         name: str = None,
         save_path: str = None,
+        progress: Callable[[float, str], None] = None,
+        pyplot: bool = True,
     ) -> Figure:
         """
         Plot a heatmap of gene expression along a PAGA path.
         
         Notes
         -----
-        - If `save_df` is True, the resulting DataFrame will be saved to `self.uns[name]`.
-        - Because of how `scanpy.pl.paga_path` is implemented, makes most sense to
-            create a figure and axes object inside of this method.
+        - If `save_df` is True, the resulting DataFrame will be saved to
+            `save_path` (default: `./reports/results/pagapath_<name>.csv`).
+        - For several gene sets on the same path, `pagapath_hmaps` orders
+            the cells and reads the expression matrix only once.
+        - `progress` and `pyplot` are passed to `pagapath_hmaps`.
         """
-        # -- Configure data --
-        # Withouth assigning `distance`, `paga_path` throws a type error (??)
-        self.assign_obs(key='distance', value_func=lambda ad: ad.obs['dpt_pseudotime'])
-        
-        # -- Configure plot --
+        if name is None:
+            name = '_'.join(nodes)
+        figures = self.pagapath_hmaps(
+            nodes,
+            {name: gene_set},
+            plot_kwargs=plot_kwargs,
+            height=height,
+            save_df=save_df,
+            save_paths={name: save_path} if save_path is not None else None,
+            progress=progress,
+            pyplot=pyplot,
+        )
+        return figures[name]
+
+    def pagapath_hmaps(
+        self,
+        nodes: List[str],
+        gene_sets: Dict[str, List[str]],
+        plot_kwargs: Dict = {},
+        height: float = 6,
+        save_df: bool = False,
+        save_paths: Dict[str, str] = None,
+        progress: Callable[[float, str], None] = None,
+        pyplot: bool = True,
+    ) -> Dict[str, Figure]:
+        """
+        Plot heatmaps of gene expression along a PAGA path, one per gene set.
+
+        Notes
+        -----
+        - The path is walked once and all genes are read in one slice (see
+            `PagaPath`); the figures match those of `scanpy.pl.paga_path`.
+        - If `save_df` is True, each gene set's DataFrame is saved to
+            `save_paths[name]` (default: `./reports/results/pagapath_<name>.csv`).
+        - `progress(fraction, message)` is called before each stage (e.g.,
+            `Job.report`, which stops a cancelled job there).
+        - Without `pyplot`, the figures are not registered with pyplot (no
+            `plt.show`/`plt.close`), so several threads can plot at once.
+        """
+        def report(fraction, message):
+            if progress is not None:
+                progress(fraction, message)
+
         default_plot_kwargs = dict(
             show_node_names=False,
             ytick_fontsize=12,
@@ -191,55 +813,104 @@ class TLSAnnDataAccessor(
             normalize_to_zero_one=True,
         )
         default_plot_kwargs.update(plot_kwargs)
-        fig, ax = plt.subplots()
-        paga_path_kwargs = dict(
-            nodes=nodes,
-            keys=gene_set,
-            annotations=['distance'],
-            return_data=save_df,
-            ax=ax,
-            show=False
-        )
-
-        # -- Plot --
-        if save_df is False:
-            self.paga_path(**paga_path_kwargs, **default_plot_kwargs)
-
-        # Registered extension method doens't work to return a DataFrame
-        else:
-            __, df = sc.pl.paga_path(self._obj, **paga_path_kwargs, **default_plot_kwargs)
-
-            # Save results
-            if save_path is None:
-                if name is None:
-                    name = '_'.join(nodes)
-                save_path = f'./reports/results/pagapath_{name}.csv'
-                
-            if not isinstance(save_path, Path):
-                save_path = Path(save_path)
-                
-            if save_path.exists():
-                raise FileExistsError(f'File {save_path} already exists.')
-
-            if not save_path.parent.exists():
-                save_path.parent.mkdir(parents=True)
-
-            df.to_csv(save_path)
+        normalize = default_plot_kwargs.pop('normalize_to_zero_one')
+        path_kwargs = {
+            key: default_plot_kwargs.pop(key)
+            for key in self._pagapath_params
+            if key in default_plot_kwargs
+        }
+
+        report(0.0, 'Ordering cells by pseudotime ...')
+        path = self.pagapath(nodes, **path_kwargs)
+        report(0.2, 'Reading expression along the path ...')
+        frames = path.frames(gene_sets, normalize=normalize)
+
+        figures = {}
+        for i, (name, df) in enumerate(frames.items()):
+            try:
+                report(0.5 + 0.5 * i / len(frames), f'Plotting {name} ...')
+            except BaseException:
+                # Stopped between figures: don't leave those plotted so far open
+                if pyplot:
+                    for fig in figures.values():
+                        plt.close(fig)
+                raise
+            if pyplot:
+                fig, ax = plt.subplots()
+            else:
+                fig = Figure()
+                ax = fig.add_subplot()
+            path.plot(df, ax=ax, **default_plot_kwargs)
+
+            # Aesthetics
+            ax.set_frame_on(False)
+            fig.set_size_inches(height, len(gene_sets[name])/(height*(2/3)))
+            figures[name] = fig
+
+            if save_df:
+                save_path = (save_paths or {}).get(name) or f'./reports/results/pagapath_{name}.csv'
+                save_frame(df, save_path)
+
+        return figures
+
+    def render_pagapath_hmap(
+        self,
+        nodes: List[str],
+        gene_set: List[str],
+        plot_kwargs: Dict = {},
+        height: float = 6,
+        dpi: int = 100,
+        progress: Callable[[float, str], None] = None,
+    ) -> bytes:
+        """
+        PNG of `pagapath_hmap`, cached in `render_cache` by (dataset, nodes,
+        genes, plotting arguments). `progress` is called as in
+        `pagapath_hmaps`, only if the image is rendered.
 
-        # Aesthetics
-        ax.set_frame_on(False)
-        fig.set_size_inches(height, len(gene_set)/(height*(2/3)))
+        Figures are made outside pyplot, whose state is process-global, so
+        renders on several threads (e.g., app jobs) don't draw on each other.
+        """
+        def render():
+            fig = self.pagapath_hmap(nodes, gene_set, plot_kwargs=plot_kwargs, height=height,
+                                     progress=progress, pyplot=False)
+            buffer = BytesIO()
+            fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+            return buffer.getvalue()
 
-        return fig
+        return self._cached_render(render, 'pagapath', tuple(nodes), tuple(gene_set),
+                                   fingerprint(plot_kwargs), height, dpi)
 
     # ~*~
 
     @classmethod
-    def from_file(cls, path) -> None:
-        return cls(sc.read(path, sparse=True))
+    def from_file(
+        cls,
+        path,
+        backed: str = None,
+        gene_store: Union[str, Path] = None,
+    ) -> None:
+        """
+        Read an `.h5ad` file.
+
+        With `backed='r'`, only the annotations are loaded; the expression
+        matrix stays on disk and is read for the selected cells once an
+        in-place method needs it. With `gene_store`, single-gene lookups are
+        read from that `GeneStore`.
+        """
+        accessor = cls(sc.read(path, sparse=True, backed=backed))
+        if gene_store is not None:
+            accessor.attach_gene_store(gene_store)
+        return accessor
 
     def copy(self) -> None:
-        return TLSAnnDataAccessor(self._obj.copy())
+        if self._lazy:
+            # Copy-on-write: the copy is made by the first in-place method
+            index = np.arange(self._base.n_obs) if self._index is None else self._index
+            return self._derive(index)
+        copied = type(self)(_to_memory(self._obj))
+        copied._gene_store = self._gene_store
+        copied._memo = self._memo
+        return copied
 
     def __repr__(self):
         return (f'TLSAccessor object with '
@@ -248,8 +919,5 @@ class TLSAnnDataAccessor(
     
     # ~~~~ Methods that are not implemented ~~~~
     
-    def query():
-        raise NotImplementedError
-
     def assign():
         raise NotImplementedError
\ No newline at end of file
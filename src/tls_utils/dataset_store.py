@@ -0,0 +1,213 @@
+import fcntl
+import json
+import os
+from pathlib import Path
+import shutil
+from typing import Callable, Dict, Union
+
+import numpy as np
+import scanpy as sc
+from scipy import sparse
+
+from TLS.src.tls_utils.gene_store import GeneStore
+
+
+def _index_dtype(nnz: int) -> type:
+    return np.int32 if nnz < np.iinfo(np.int32).max else np.int64
+
+
+def _save_matrix(path: Path, X, chunk_size: int) -> None:
+    """Write `X` as `.npy` files, reading `chunk_size` rows at a time."""
+    path.mkdir(parents=True)
+    n_obs, n_vars = X.shape
+
+    def chunks():
+        for start in range(0, n_obs, chunk_size):
+            yield start, X[start:min(start + chunk_size, n_obs)]
+
+    if not sparse.issparse(X[:1]):
+        dense = np.lib.format.open_memmap(path / 'X.npy', mode='w+', dtype=np.float32, shape=(n_obs, n_vars))
+        for start, chunk in chunks():
+            dense[start:start + chunk.shape[0]] = np.asarray(chunk)
+        dense.flush()
+        return
+
+    # -- Count non-zeros per row, then fill; indices and indptr share one
+    # dtype so scipy wraps the mapped arrays without casting
+    row_counts = np.zeros(n_obs, dtype=np.int64)
+    for start, chunk in chunks():
+        chunk = sparse.csr_matrix(chunk)
+        chunk.sum_duplicates()
+        row_counts[start:start + chunk.shape[0]] = np.diff(chunk.indptr)
+
+    nnz = int(row_counts.sum())
+    dtype = _index_dtype(max(nnz, n_vars))
+    indptr = np.concatenate([[0], np.cumsum(row_counts)]).astype(dtype)
+    np.save(path / 'indptr.npy', indptr)
+    indices = np.lib.format.open_memmap(path / 'indices.npy', mode='w+', dtype=dtype, shape=(nnz,))
+    data = np.lib.format.open_memmap(path / 'data.npy', mode='w+', dtype=np.float32, shape=(nnz,))
+    for start, chunk in chunks():
+        chunk = sparse.csr_matrix(chunk)
+        chunk.sum_duplicates()
+        lo, hi = indptr[start], indptr[start + chunk.shape[0]]
+        indices[lo:hi] = chunk.indices
+        data[lo:hi] = chunk.data
+    indices.flush()
+    data.flush()
+
+
+def _load_matrix(path: Path, shape) -> Union[np.ndarray, sparse.csr_matrix]:
+    """Read-only, memory-mapped view of a matrix written by `_save_matrix`."""
+    if (path / 'X.npy').exists():
+        return np.load(path / 'X.npy', mmap_mode='r')
+    arrays = [np.load(path / f'{name}.npy', mmap_mode='r') for name in ['data', 'indices', 'indptr']]
+    return sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+class DatasetStore:
+    """
+    An `AnnData` laid out as memory-mapped `.npy` files, for sharing.
+
+    The matrices (`X`, `.raw`, `layers`, `obsm`, `obsp`) are written once
+    as `.npy` files and opened with `mmap_mode='r'`: every process that
+    opens the store maps the same pages of the OS page cache, so memory
+    stays flat as processes (e.g., app replicas) are added. Only the
+    annotations (`obs`, `var`, `uns`) are read into each process.
+
+    Notes
+    -----
+    - The arrays are read-only. In-place `.tls` methods copy the data
+        into the accessor first (see `TLSAnnDataAccessor._materialize`),
+        so use `.tls.lazy()` on a shared store: the store's own accessor
+        would otherwise keep the modified copy.
+    - A `GeneStore` of the data is built into `genes/` and attached by
+        `shared_dataset`, for single-gene reads.
+    - For a copy held in RAM only, put the store on a `tmpfs` (e.g.,
+        `/dev/shm`).
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path / 'meta.json') as f:
+            self.meta = json.load(f)
+
+    @property
+    def version(self) -> str:
+        return self.meta['version']
+
+    @property
+    def shape(self):
+        return tuple(self.meta['shape'])
+
+    @property
+    def gene_store_path(self) -> Path:
+        return self.path / 'genes'
+
+    def __repr__(self):
+        return (f'DatasetStore with {self.shape[0]} cells and '
+                f'{self.shape[1]} genes at {self.path}')
+
+    def to_anndata(self) -> sc.AnnData:
+        """An `AnnData` whose matrices are read-only views of the store."""
+        annotations = sc.read_h5ad(self.path / 'annotations.h5ad')
+        adata = sc.AnnData(
+            X=_load_matrix(self.path / 'X', self.shape),
+            obs=annotations.obs,
+            var=annotations.var,
+            uns=annotations.uns,
+            obsm={key: np.load(self.path / 'obsm' / f'{key}.npy', mmap_mode='r') for key in self.meta['obsm']},
+            obsp={key: _load_matrix(self.path / 'obsp' / key, (self.shape[0],) * 2) for key in self.meta['obsp']},
+            layers={key: _load_matrix(self.path / 'layers' / key, self.shape) for key in self.meta['layers']},
+        )
+        if self.meta['raw_shape'] is not None:
+            raw_var = sc.read_h5ad(self.path / 'raw_var.h5ad').var
+            adata.raw = sc.AnnData(X=_load_matrix(self.path / 'raw', self.meta['raw_shape']),
+                                   obs=annotations.obs, var=raw_var)
+        adata.uns['dataset_store'] = dict(path=str(self.path), version=self.version)
+        return adata
+
+    @classmethod
+    def build(
+        cls,
+        adata: sc.AnnData,
+        path: Union[str, Path],
+        version: str,
+        chunk_size: int = 10000,
+    ) -> 'DatasetStore':
+        """
+        Write the store for `adata` to `path`.
+
+        Matrices are read in chunks of `chunk_size` rows, so backed objects
+        are never loaded whole. The store is written next to `path` and
+        renamed into place, so processes never open a partial store.
+        """
+        path = Path(path)
+        tmp_path = path.with_name(f'{path.name}.tmp-{os.getpid()}')
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+
+        _save_matrix(tmp_path / 'X', adata.X, chunk_size)
+        for key, value in adata.layers.items():
+            _save_matrix(tmp_path / 'layers' / key, value, chunk_size)
+        for key, value in adata.obsp.items():
+            _save_matrix(tmp_path / 'obsp' / key, value, chunk_size)
+        (tmp_path / 'obsm').mkdir()
+        for key, value in adata.obsm.items():
+            np.save(tmp_path / 'obsm' / f'{key}.npy', np.asarray(value))
+
+        raw_shape = None
+        if adata.raw is not None:
+            raw_shape = list(adata.raw.shape)
+            _save_matrix(tmp_path / 'raw', adata.raw.X, chunk_size)
+            sc.AnnData(var=adata.raw.var).write_h5ad(tmp_path / 'raw_var.h5ad')
+        GeneStore.build(adata, tmp_path / 'genes', chunk_size=chunk_size)
+
+        uns = {key: value for key, value in adata.uns.items() if key != 'dataset_store'}
+        sc.AnnData(obs=adata.obs, var=adata.var, uns=uns).write_h5ad(tmp_path / 'annotations.h5ad')
+        with open(tmp_path / 'meta.json', 'w') as f:
+            json.dump(dict(
+                version=version,
+                shape=list(adata.shape),
+                raw_shape=raw_shape,
+                obsm=list(adata.obsm.keys()),
+                obsp=list(adata.obsp.keys()),
+                layers=list(adata.layers.keys()),
+            ), f)
+
+        os.replace(tmp_path, path)
+        return cls(path)
+
+
+# Stores attached in this process, by path
+_attached: Dict[Path, sc.AnnData] = {}
+
+
+def shared_dataset(
+    root: Union[str, Path],
+    version: str,
+    load: Callable[[], sc.AnnData] = None,
+) -> sc.AnnData:
+    """
+    Data of the store `<root>/<version>`, attached once per process.
+
+    If the store does not exist yet, it is built from `load()` by the first
+    process to get there; the others wait for it (on a lock file) and then
+    attach the same files.
+    """
+    path = Path(root) / version
+    if path not in _attached:
+        if not (path / 'meta.json').exists():
+            if load is None:
+                raise FileNotFoundError(f'No dataset store at {path}')
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path.with_name(f'{version}.lock'), 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not (path / 'meta.json').exists():
+                    DatasetStore.build(load(), path, version=version)
+
+        store = DatasetStore(path)
+        adata = store.to_anndata()
+        adata.tls.attach_gene_store(store.gene_store_path)
+        _attached[path] = adata
+    return _attached[path]
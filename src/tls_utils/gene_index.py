@@ -0,0 +1,95 @@
+import csv
+from pathlib import Path
+from typing import Dict, Iterable, List, Union
+
+import numpy as np
+
+
+class GeneIndex:
+    """
+    Case-insensitive lookup and prefix completion of gene names.
+
+    Gene names and their synonyms are lower-cased and sorted once; a lookup
+    or a completion is then a binary search (`np.searchsorted`) of that
+    array, so answering a keystroke does not scale with the number of
+    genes and never touches the expression data.
+
+    Notes
+    -----
+    - A synonym resolves to its gene; names that exist in the data always
+        take precedence over synonyms.
+    - Where names differ only in case, an exact (case-sensitive) match wins.
+    """
+
+    def __init__(self, genes: Iterable[str], synonyms: Dict[str, str] = None):
+        genes = [str(gene) for gene in genes]
+        self._genes = set(genes)
+        names = genes + [
+            synonym for synonym, gene in (synonyms or {}).items()
+            if gene in self._genes and synonym not in self._genes
+        ]
+        targets = genes + [(synonyms or {})[synonym] for synonym in names[len(genes):]]
+
+        keys = np.array([name.lower() for name in names], dtype=str)
+        order = np.argsort(keys, kind='stable')  # genes before synonyms for equal keys
+        self._keys = keys[order]
+        self._targets = np.array(targets, dtype=object)[order]
+
+    def __len__(self):
+        return len(self._genes)
+
+    def __contains__(self, name: str) -> bool:
+        return self.resolve(name) is not None
+
+    def __repr__(self):
+        return f'GeneIndex with {len(self._genes)} genes and {len(self._keys) - len(self._genes)} synonyms'
+
+    def _range(self, prefix: str) -> slice:
+        prefix = prefix.lower()
+        lo = np.searchsorted(self._keys, prefix, side='left')
+        hi = np.searchsorted(self._keys, prefix + '\U0010ffff', side='left')
+        return slice(lo, hi)
+
+    def resolve(self, name: str) -> Union[str, None]:
+        """The gene `name` refers to (in any case, or as a synonym), or None."""
+        name = name.strip()
+        if name in self._genes:
+            return name
+
+        key = name.lower()
+        lo = np.searchsorted(self._keys, key, side='left')
+        if lo < len(self._keys) and self._keys[lo] == key:
+            return self._targets[lo]
+        return None
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Up to `limit` genes whose names (or synonyms) start with `prefix`.
+
+        Without any, completions of the longest prefix of `prefix` that has
+        some are returned (e.g., for a typo in the last letters).
+        """
+        prefix = prefix.strip()
+        for end in range(len(prefix), 0, -1):
+            matches = self._range(prefix[:end])
+            if matches.stop > matches.start:
+                break
+        else:
+            return []
+
+        # Shortest names first, so a complete name is never cut off by its extensions
+        keys = self._keys[matches]
+        order = np.argsort(np.char.str_len(keys), kind='stable')
+        suggestions = []
+        for target in self._targets[matches][order]:
+            if target not in suggestions:
+                suggestions.append(target)
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+    @staticmethod
+    def read_synonyms(path: Union[str, Path]) -> Dict[str, str]:
+        """Synonyms from a tab-separated file of (synonym, gene) rows."""
+        with open(path, newline='') as f:
+            return {row[0].strip(): row[1].strip() for row in csv.reader(f, delimiter='\t') if len(row) >= 2}
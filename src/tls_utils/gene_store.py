@@ -0,0 +1,121 @@
+import json
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import scanpy as sc
+from scipy import sparse
+
+
+class GeneStore:
+    """
+    Column-major (CSC) copy of an expression matrix for single-gene reads.
+
+    The store is a directory of `.npy` files that are memory-mapped on open,
+    so reading one gene touches only that gene's non-zeros instead of every
+    row of a CSR matrix.
+
+    Notes
+    -----
+    - By default, the store is a sidecar of the `.h5ad` it was built from
+        (`<name>.genes`, see `default_path`).
+    - Like scanpy's plotting functions, `build` reads `adata.raw` when present.
+    """
+
+    _arrays = ['indptr', 'indices', 'data', 'obs_names', 'var_names']
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path / 'meta.json') as f:
+            self.meta = json.load(f)
+
+        for name in self._arrays:
+            setattr(self, name, np.load(self.path / f'{name}.npy', mmap_mode='r'))
+        self._var_index = pd.Index(self.var_names)
+
+    @property
+    def shape(self):
+        return tuple(self.meta['shape'])
+
+    @staticmethod
+    def default_path(h5ad_path: Union[str, Path]) -> Path:
+        return Path(h5ad_path).with_suffix('.genes')
+
+    def __contains__(self, gene: str) -> bool:
+        return gene in self._var_index
+
+    def __repr__(self):
+        return (f'GeneStore with {self.shape[0]} cells and '
+                f'{self.shape[1]} genes at {self.path}')
+
+    def get(self, gene: str) -> np.ndarray:
+        """Dense expression of `gene` across all cells."""
+        try:
+            j = self._var_index.get_loc(gene)
+        except KeyError:
+            raise KeyError(f'Gene {gene} not found in {self.path}') from None
+
+        start, stop = self.indptr[j], self.indptr[j + 1]
+        values = np.zeros(self.shape[0], dtype=self.data.dtype)
+        values[self.indices[start:stop]] = self.data[start:stop]
+        return values
+
+    @classmethod
+    def build(
+        cls,
+        adata: sc.AnnData,
+        path: Union[str, Path],
+        use_raw: bool = True,
+        chunk_size: int = 10000,
+    ) -> 'GeneStore':
+        """
+        Write the CSC store for `adata` to `path`.
+
+        Rows are read in chunks of `chunk_size` cells (twice: once to count
+        non-zeros per gene, once to fill), so backed objects are never
+        loaded whole.
+        """
+        source = adata.raw if use_raw and adata.raw is not None else adata
+        X = source.X
+        n_obs, n_vars = source.shape
+
+        def chunks():
+            for start in range(0, n_obs, chunk_size):
+                chunk = X[start:min(start + chunk_size, n_obs)]
+                chunk = sparse.csr_matrix(chunk)
+                chunk.sum_duplicates()
+                yield start, chunk
+
+        # -- Count non-zeros per gene
+        counts = np.zeros(n_vars, dtype=np.int64)
+        for __, chunk in chunks():
+            counts += np.bincount(chunk.indices, minlength=n_vars)
+
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        index_dtype = np.int32 if n_obs < np.iinfo(np.int32).max else np.int64
+        indices = np.empty(indptr[-1], dtype=index_dtype)
+        data = np.empty(indptr[-1], dtype=np.float32)
+
+        # -- Fill; rows arrive in order, so cells stay sorted within each gene
+        fill = indptr[:-1].copy()
+        for start, chunk in chunks():
+            chunk = chunk.tocsc()
+            chunk_counts = np.diff(chunk.indptr)
+            dest = np.repeat(fill, chunk_counts) + (
+                np.arange(chunk.nnz) - np.repeat(chunk.indptr[:-1], chunk_counts))
+            indices[dest] = chunk.indices + start
+            data[dest] = chunk.data
+            fill += chunk_counts
+
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / 'indptr.npy', indptr)
+        np.save(path / 'indices.npy', indices)
+        np.save(path / 'data.npy', data)
+        np.save(path / 'obs_names.npy', np.asarray(adata.obs_names, dtype=str))
+        np.save(path / 'var_names.npy', np.asarray(source.var_names, dtype=str))
+        with open(path / 'meta.json', 'w') as f:
+            json.dump(dict(shape=[n_obs, n_vars], use_raw=source is not adata), f)
+
+        return cls(path)
@@ -0,0 +1,121 @@
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+import pickle
+import threading
+from typing import Any, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def file_digest(path: Union[str, Path], memo_path: Union[str, Path] = None) -> str:
+    """
+    SHA-256 of a file's contents.
+
+    If `memo_path` is given, digests are remembered there by (size, mtime),
+    so an unchanged file is only hashed once. The memo is replaced in one
+    rename, as processes read it concurrently; an unreadable memo counts
+    as empty.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    memo = {}
+    if memo_path is not None:
+        try:
+            with open(memo_path) as f:
+                memo = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            memo = {}
+
+    entry = memo.get(str(path))
+    if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['digest']
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            digest.update(block)
+    digest = digest.hexdigest()
+
+    if memo_path is not None:
+        memo[str(path)] = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, digest=digest)
+        Path(memo_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f'{memo_path}.tmp-{os.getpid()}-{threading.get_ident()}'
+        with open(tmp_path, 'w') as f:
+            json.dump(memo, f, indent=2)
+        os.replace(tmp_path, memo_path)
+
+    return digest
+
+
+def _const_fingerprint(const) -> Any:
+    if inspect.iscode(const):
+        return _code_fingerprint(const)
+    if isinstance(const, frozenset):
+        # Iteration order of sets (e.g. `x in {'a', 'b'}`) varies across processes
+        return sorted(repr(c) for c in const)
+    return repr(const)
+
+
+def _code_fingerprint(code) -> list:
+    consts = [_const_fingerprint(c) for c in code.co_consts]
+    return [code.co_code.hex(), consts, list(code.co_names)]
+
+
+def _jsonable(obj: Any) -> Any:
+    if callable(obj) and hasattr(obj, '__code__'):
+        # Functions (incl. lambdas) are identified by their code, plus the
+        # simple module-level constants they read
+        constants = {
+            name: obj.__globals__[name]
+            for name in obj.__code__.co_names
+            if isinstance(obj.__globals__.get(name), (str, int, float, bool, tuple, list, dict))
+        }
+        return dict(code=_code_fingerprint(obj.__code__), constants=_jsonable(constants))
+
+    if isinstance(obj, dict):
+        return {str(k): _jsonable(v) for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(obj, (set, frozenset)):
+        return sorted(_jsonable(v) for v in obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (list, tuple)) or hasattr(obj, '__iter__') and not isinstance(obj, str):
+        return [_jsonable(v) for v in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+
+    return repr(obj)
+
+
+def fingerprint(*parts) -> str:
+    """Stable SHA-256 of JSON-able parts (functions are hashed by their code)."""
+    payload = json.dumps(_jsonable(list(parts)), sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def data_digest(obj: Any) -> str:
+    """
+    Digest of in-memory data (arrays, sparse matrices, frames, or anything
+    picklable), for comparing data within one process.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(obj, np.ndarray) and obj.dtype != object:
+        digest.update(f'{obj.dtype}{obj.shape}'.encode())
+        digest.update(np.ascontiguousarray(obj).view(np.uint8).data)
+    elif sparse.issparse(obj):
+        obj = obj.tocsr()
+        digest.update(f'{obj.dtype}{obj.shape}'.encode())
+        for array in (obj.indptr, obj.indices, obj.data):
+            digest.update(np.ascontiguousarray(array).view(np.uint8).data)
+    elif isinstance(obj, (pd.Series, pd.DataFrame, pd.Index)):
+        digest.update(pd.util.hash_pandas_object(obj, index=not isinstance(obj, pd.Index)).values.data)
+        digest.update(repr(getattr(obj, 'dtypes', getattr(obj, 'dtype', ''))).encode())
+    else:
+        digest.update(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+import anndata
+from anndata.utils import make_index_unique
+import numpy as np
+import pandas as pd
+import scanpy as sc
+from scipy import io, sparse
+
+
+def read_10x_mtx(
+    path: Union[str, Path],
+    obs: Dict[str, str] = None,
+    barcodes: Iterable[str] = None,
+    min_cells: int = 0,
+    dtype: type = np.float32,
+) -> sc.AnnData:
+    """
+    Read a 10x `filtered_feature_bc_matrix` directory into a sparse `AnnData`.
+
+    The matrix is read straight into CSR (cells x genes) and filtered while
+    still sparse, so memory scales with the number of non-zeros.
+
+    Parameters
+    ----------
+    path
+        Directory with `matrix.mtx.gz`, `barcodes.tsv.gz` and `features.tsv.gz`.
+    obs
+        Constant `obs` columns to add (e.g., `sample`, `region`, `donor`).
+    barcodes
+        If given, keep only these cells (in file order).
+    min_cells
+        Keep only genes detected in at least this many of the kept cells.
+
+    Notes
+    -----
+    - `var` is indexed by gene symbol, with the Ensembl ID in `gene_id`, and
+        `obs` by barcode, as in the original velocity notebooks.
+    """
+    path = Path(path)
+    X = io.mmread(path / 'matrix.mtx.gz')
+    X = sparse.csr_matrix(X.T, dtype=dtype)
+
+    obs_df = pd.read_csv(path / 'barcodes.tsv.gz', header=None, sep='\t', usecols=[0], names=['barcode'])
+    obs_df = obs_df.set_index('barcode')
+    var_df = pd.read_csv(path / 'features.tsv.gz', header=None, sep='\t', usecols=[0, 1],
+                         names=['gene_id', 'gene_symbol'])
+    var_df = var_df.set_index('gene_symbol')
+
+    if barcodes is not None:
+        keep = obs_df.index.isin(pd.Index(barcodes))
+        X, obs_df = X[keep], obs_df[keep]
+
+    if min_cells > 0:
+        X.sum_duplicates()
+        n_cells = np.bincount(X.indices, minlength=X.shape[1])
+        keep = n_cells >= min_cells
+        X, var_df = X[:, keep], var_df[keep]
+
+    for key, value in (obs or {}).items():
+        obs_df[key] = value
+
+    return sc.AnnData(X, obs=obs_df, var=var_df)
+
+
+def read_samples(
+    samples: Union[List[str], Dict[str, Dict]],
+    read: Callable = read_10x_mtx,
+    max_workers: int = None,
+    processes: bool = False,
+) -> List[sc.AnnData]:
+    """
+    Read several samples concurrently, as `read(sample, **kwargs)`.
+
+    `samples` is a list of paths, or maps paths to keyword arguments for
+    `read`. Threads are used by default (the readers spend most of their
+    time in I/O and C code); with `processes`, `read` must be picklable.
+    """
+    if not isinstance(samples, dict):
+        samples = {sample: {} for sample in samples}
+
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool(max_workers=max_workers or len(samples)) as executor:
+        futures = [executor.submit(read, sample, **kwargs) for sample, kwargs in samples.items()]
+        return [future.result() for future in futures]
+
+
+def load_timepoints(
+    samples: Union[List[str], Dict[str, Dict]],
+    read: Callable = read_10x_mtx,
+    barcode_sep: str = '-',
+    max_workers: int = None,
+    processes: bool = False,
+) -> sc.AnnData:
+    """
+    Read samples concurrently and concatenate them in a single pass.
+
+    Barcodes are made unique across samples before concatenating: each is
+    cut at `barcode_sep` (dropping 10x's `-1`) and repeats get `_1`, `_2`,
+    ... in sample order, as the chained `concatenate` calls of the velocity
+    notebooks did. Genes are inner-joined and `var` columns kept where they
+    agree across samples.
+
+    Parameters
+    ----------
+    samples
+        Paths, or paths mapped to keyword arguments for `read`.
+    read
+        Reader for one sample (default: `read_10x_mtx`).
+    barcode_sep
+        Separator of barcode suffixes to drop, or `None` to keep names.
+    """
+    adatas = read_samples(samples, read=read, max_workers=max_workers, processes=processes)
+
+    obs_names = pd.Index(np.concatenate([adata.obs_names.values for adata in adatas]))
+    if barcode_sep is not None:
+        obs_names = obs_names.str.split(barcode_sep).str[0]
+    obs_names = make_index_unique(obs_names, join='_')
+
+    start = 0
+    for adata in adatas:
+        adata.var_names_make_unique()
+        adata.obs_names = obs_names[start:start + adata.n_obs]
+        start += adata.n_obs
+
+    return anndata.concat(adatas, join='inner', merge='same')
+
+
+def join_metadata(
+    adata: sc.AnnData,
+    *tables: Tuple[Union[str, Path, pd.DataFrame], Union[Dict[str, str], List[str]]],
+    key: str = 'BC',
+    drop_unmatched: bool = True,
+) -> sc.AnnData:
+    """
+    Attach columns of per-cell tables (e.g., Seurat UMAP or clusters) to `obs`.
+
+    Each table is matched to `obs_names` through its `key` column with a
+    hash join, and all columns are attached at once. Cells missing from a
+    table are reported; with `drop_unmatched`, only cells found in every
+    table are kept (in their original order), otherwise their values are
+    missing.
+
+    Parameters
+    ----------
+    tables
+        Pairs of a table (a `.tsv` path or a `DataFrame`) and its columns
+        to attach, as a list or as a mapping to new `obs` column names.
+    key
+        Column of the tables holding the barcodes.
+    """
+    joined = []
+    matched = np.ones(adata.n_obs, dtype=bool)
+    for source, columns in tables:
+        meta = source if isinstance(source, pd.DataFrame) else pd.read_csv(source, sep='\t')
+        name = 'table' if isinstance(source, pd.DataFrame) else Path(source).name
+        if key in meta.columns:
+            meta = meta.set_index(key)
+        if not meta.index.is_unique:
+            raise ValueError(f'Duplicate barcodes in {name}')
+
+        found = meta.index.get_indexer(adata.obs_names) >= 0
+        if not found.all():
+            missing = adata.obs_names[~found]
+            sc.logging.warning(f'{len(missing)} of {adata.n_obs} cells not found in {name} '
+                               f'(e.g., {", ".join(missing[:3])})')
+        matched &= found
+
+        if not isinstance(columns, dict):
+            columns = {column: column for column in columns}
+        joined.append((meta, columns))
+
+    if drop_unmatched and not matched.all():
+        adata = adata[matched].copy()
+
+    for meta, columns in joined:
+        for column, obs_column in columns.items():
+            adata.obs[obs_column] = meta[column].reindex(adata.obs_names).values
+
+    return adata
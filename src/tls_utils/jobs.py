@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import threading
+from typing import Any, Callable, Hashable
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    A function running on a `JobRunner`, with its progress.
+
+    The function is called with the job as its first argument, and reports
+    progress with `report` and checks for cancellation with
+    `raise_if_cancelled` between its stages.
+    """
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.progress = 0.0
+        self.message = ''
+        self.future: Future = None
+        self._cancelled = threading.Event()
+        self._waiters = set()  # callers that still want the result (see `JobRunner`)
+        self._resumed = False  # cancelled, then submitted again before it stopped
+        self._stopped = False  # stopped by a cancellation
+
+    def __repr__(self):
+        state = 'done' if self.done() else f'{self.progress:.0%} {self.message}'.strip()
+        return f'Job({self.key!r}, {state})'
+
+    def report(self, progress: float, message: str = None) -> None:
+        self.raise_if_cancelled()
+        self.progress = progress
+        if message is not None:
+            self.message = message
+
+    def cancel(self) -> None:
+        """Stop the job before it starts, or at its next stage, whoever waits on it."""
+        self._cancelled.set()
+        if self.future is not None:  # not yet set while `submit` is starting it
+            self.future.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled(self.key)
+
+    def wait_for(self, other: 'Job', poll: float = 0.2) -> Any:
+        """The result of `other`, checking for this job's cancellation while waiting."""
+        while True:
+            try:
+                return other.result(timeout=poll)
+            except FutureTimeoutError:
+                self.raise_if_cancelled()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    @property
+    def failed(self) -> bool:
+        return self.done() and (self.future.cancelled() or self.future.exception() is not None)
+
+    def result(self, timeout: float = None) -> Any:
+        return self.future.result(timeout)
+
+
+class JobRunner:
+    """
+    Runs jobs on background threads, one per key.
+
+    Submitting a key that is running returns the running job (so callers,
+    e.g., several sessions of the app, share its work), and submitting one
+    that finished returns its result at once.
+
+    Callers submit as a `waiter` (e.g., a session id) and `detach` when they
+    no longer want the result; a job is cancelled once its last waiter has
+    detached, so one caller never cancels another's work.
+
+    Notes
+    -----
+    - The results of the last `max_results` finished jobs are kept.
+    - Failed jobs, and cancelled jobs that stopped, are not kept; submitting
+        their key again starts a new job. A cancelled job that is still
+        running is resumed instead, so its work is never duplicated.
+    """
+
+    def __init__(self, max_workers: int = None, max_results: int = 32):
+        self.max_results = max_results
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tls-job')
+        self._jobs = OrderedDict()  # key -> job, least recently submitted first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def get(self, key: Hashable) -> Job:
+        with self._lock:
+            return self._jobs.get(key)
+
+    def submit(self, key: Hashable, func: Callable, *args, waiter: Hashable = None, **kwargs) -> Job:
+        """
+        The job for `key`, started as `func(job, *args, **kwargs)` unless
+        running or done, with `waiter` (if given) waiting on it.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.failed and not job._stopped:
+                if job.cancelled:
+                    job._cancelled.clear()
+                    job._resumed = True
+                if waiter is not None:
+                    job._waiters.add(waiter)
+                self._jobs.move_to_end(key)
+                return job
+
+            job = Job(key)
+            if waiter is not None:
+                job._waiters.add(waiter)
+            job.future = self._executor.submit(self._run, job, func, args, kwargs)
+            self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            self._trim()
+        return job
+
+    def detach(self, key: Hashable, waiter: Hashable) -> None:
+        """Stop `waiter` waiting on the job for `key`, cancelling the job if no one else is."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or waiter not in job._waiters:
+                return
+            job._waiters.discard(waiter)
+            if not job._waiters and not job.done():
+                job.cancel()
+
+    def _run(self, job: Job, func: Callable, args, kwargs) -> Any:
+        while True:
+            try:
+                job.raise_if_cancelled()
+                result = func(job, *args, **kwargs)
+                break
+            except JobCancelled:
+                with self._lock:
+                    if job.cancelled or not job._resumed:
+                        job._stopped = True
+                        raise
+                    # Submitted again while stopping: start over, on this thread
+                    job._resumed = False
+        job.progress = 1.0
+        return result
+
+    def _trim(self) -> None:
+        finished = [key for key, job in self._jobs.items() if job.done()]
+        for key in finished[:max(len(finished) - self.max_results, 0)]:
+            del self._jobs[key]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,121 @@
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+
+class ObsIndex:
+    """
+    Inverted index from the categories of `obs` columns to cell positions.
+
+    For each indexed column, every category maps to a sorted `int32` array
+    of the positions of its cells. The columns in `keys` are indexed up
+    front, any other column on first use. The index reports itself stale
+    once `obs` or an indexed column is replaced.
+
+    Notes
+    -----
+    - Compound queries are answered by merging position arrays, so their cost
+        scales with the sizes of the categories involved (and, within a
+        selection, of the selection) rather than with `n_obs`. Queries with
+        only `exclude` start from all candidate cells, so they scale with
+        the selection, or with `n_obs` without one.
+    """
+
+    def __init__(self, obs: pd.DataFrame, keys: Iterable[str] = ()):
+        self._obs = obs
+        self._columns = {}
+        self._postings = {}
+        for key in keys:
+            if key in obs.columns:
+                self._build(key)
+
+    def is_stale(self, obs: pd.DataFrame) -> bool:
+        if obs is not self._obs:
+            return True
+        return any(obs[key].values is not column for key, column in self._columns.items())
+
+    def _build(self, key: str) -> Dict:
+        column = self._obs[key].values
+        values = column if isinstance(column, pd.Categorical) else pd.Categorical(column)
+
+        # A stable sort of the codes keeps positions sorted within each category
+        order = np.argsort(values.codes, kind='stable').astype(np.int32)
+        counts = np.bincount(values.codes[values.codes >= 0], minlength=len(values.categories))
+        start = np.count_nonzero(values.codes < 0)
+        bounds = start + np.concatenate([[0], np.cumsum(counts)])
+
+        postings = {
+            category: order[bounds[i]:bounds[i + 1]]
+            for i, category in enumerate(values.categories)
+            if counts[i] > 0
+        }
+        self._columns[key] = column
+        self._postings[key] = postings
+        return postings
+
+    def postings(self, key: str) -> Dict:
+        if key not in self._obs.columns:
+            raise ValueError(f'Invalid key: {key}')
+        if key not in self._postings:
+            return self._build(key)
+        return self._postings[key]
+
+    def positions(
+        self,
+        key: str,
+        values: List,
+        validate: bool = True,
+        within: np.ndarray = None,
+    ) -> np.ndarray:
+        """
+        Sorted positions of cells whose `obs[key]` is in `values`.
+
+        With `within` (sorted positions), only those cells are returned, and
+        validation requires each value to have a cell among them.
+        """
+        postings = self.postings(key)
+        arrays = []
+        for value in values:
+            posting = postings.get(value)
+            if posting is not None and within is not None:
+                posting = np.intersect1d(posting, within, assume_unique=True)
+            if posting is not None and len(posting) > 0:
+                arrays.append(posting)
+            elif validate:
+                raise ValueError(f'Invalid {key}: {value}')
+
+        if len(arrays) == 0:
+            return np.empty(0, dtype=np.int32)
+        if len(arrays) == 1:
+            return arrays[0]
+        # Categories are disjoint, so sorting the concatenation is a union
+        return np.sort(np.concatenate(arrays))
+
+    def select(
+        self,
+        include: Dict[str, List] = None,
+        exclude: Dict[str, List] = None,
+        within: np.ndarray = None,
+    ) -> np.ndarray:
+        """
+        Sorted positions of cells matching every `include` and no `exclude`.
+
+        Values within a column are OR-ed, columns are AND-ed. Candidates are
+        the cells in `within` (sorted positions), or all cells.
+        """
+        selected = None
+        for key, values in (include or {}).items():
+            positions = self.positions(key, values, within=within)
+            selected = positions if selected is None else np.intersect1d(
+                selected, positions, assume_unique=True)
+
+        if selected is None:
+            selected = np.arange(len(self._obs), dtype=np.int32) if within is None else within
+
+        for key, values in (exclude or {}).items():
+            positions = self.positions(key, values, validate=False)
+            if len(positions) > 0:
+                selected = np.setdiff1d(selected, positions, assume_unique=True)
+
+        return selected
@@ -0,0 +1,259 @@
+from pathlib import Path
+from typing import Dict, List, Union
+
+import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
+import numpy as np
+import pandas as pd
+import scanpy as sc
+from scanpy.plotting._utils import _set_default_colors_for_categorical_obs
+from scipy import sparse
+
+
+def moving_average(x: np.ndarray, n: int) -> np.ndarray:
+    """Moving average over the first axis (as `scanpy`'s, for 2D arrays)."""
+    if n <= 1:
+        return np.asarray(x, dtype=float)
+    ret = np.cumsum(x, axis=0, dtype=float)
+    ret[n:] = ret[n:] - ret[:-n]
+    return ret[n - 1:] / n
+
+
+def normalize_to_zero_one(x: np.ndarray) -> np.ndarray:
+    """Scale each column to [0, 1] (constant columns become NaN, as in `scanpy`)."""
+    x = x - x.min(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return x / x.max(axis=0)
+
+
+class PagaPath:
+    """
+    Cells along a path of PAGA groups, ordered by pseudotime.
+
+    The cells of each node are ordered by `dpt_pseudotime` once, when the
+    path is built. Expression for any number of gene sets is then read in
+    a single slice of the expression matrix, and smoothed and normalised
+    for all genes at once, giving the same data as `scanpy.pl.paga_path`.
+
+    Notes
+    -----
+    - Like `scanpy.pl.paga_path`, genes are read from `.raw` if present
+        (`use_raw`), and keys found in `obs` are read from there.
+    - The `distance` annotation is `dpt_pseudotime`, unless `obs` has a
+        `distance` column; nothing is written to `adata`.
+    """
+
+    def __init__(
+        self,
+        adata: sc.AnnData,
+        nodes: List[str],
+        groups_key: str = None,
+        use_raw: bool = True,
+        n_avg: int = 1,
+        annotations: List[str] = ['distance'],
+    ):
+        if groups_key is None:
+            if 'groups' not in adata.uns.get('paga', {}):
+                raise KeyError('Pass the key of the grouping with which PAGA was run (`groups_key`).')
+            groups_key = adata.uns['paga']['groups']
+        if 'dpt_pseudotime' not in adata.obs.columns:
+            raise ValueError('A PAGA path requires a pseudotime (`tl.dpt`) to order cells.')
+
+        self.adata = adata
+        self.nodes = list(nodes)
+        self.groups_key = groups_key
+        self.use_raw = use_raw
+        self.n_avg = n_avg
+        self.annotations = list(annotations)
+
+        groups = adata.obs[groups_key].values
+        if not isinstance(groups, pd.Categorical):
+            groups = pd.Categorical(groups)
+        self.categories = groups.categories
+        node_codes = self.categories.get_indexer(self.nodes)
+        for node, code in zip(self.nodes, node_codes):
+            if code < 0:
+                raise ValueError(f'Each node needs to be in {self.categories.tolist()} ({groups_key!r}), not {node!r}.')
+
+        pseudotime = adata.obs['dpt_pseudotime'].values
+        cells, self.tick_locs = [], [0]
+        for node, code in zip(self.nodes, node_codes):
+            idcs = np.flatnonzero(groups.codes == code)
+            if len(idcs) == 0:
+                raise ValueError(f'No cells in group {node!r} of {groups_key!r}.')
+            cells.append(idcs[np.argsort(pseudotime[idcs])])
+            self.tick_locs.append(self.tick_locs[-1] + len(idcs))
+        self.cells = np.concatenate(cells)
+        self.node_codes = np.repeat(node_codes, np.diff(self.tick_locs))
+
+    @property
+    def groups(self) -> np.ndarray:
+        return moving_average(self.node_codes, self.n_avg)
+
+    def _obs(self, key: str) -> pd.Series:
+        # `distance` (scanpy's name for the pseudotime along the path) needn't be in `obs`
+        if key == 'distance' and key not in self.adata.obs.columns:
+            key = 'dpt_pseudotime'
+        return self.adata.obs[key]
+
+    def annotation(self, key: str) -> np.ndarray:
+        values = self._obs(key)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return moving_average(values.cat.codes.values[self.cells], self.n_avg)
+        return moving_average(values.values[self.cells].astype(float), self.n_avg)
+
+    def expression(self, genes: List[str], normalize: bool = True) -> pd.DataFrame:
+        """Smoothed (and normalised) values of `genes` along the path (cells x genes)."""
+        genes = list(dict.fromkeys(genes))
+        source = self.adata.raw if self.use_raw and self.adata.raw is not None else self.adata
+        obs_keys = [g for g in genes if g in self.adata.obs.columns]
+        var_keys = [g for g in genes if g not in self.adata.obs.columns]
+
+        columns = source.var_names.get_indexer(var_keys)
+        if (columns < 0).any():
+            raise KeyError(f'Genes not found: {[g for g, c in zip(var_keys, columns) if c < 0]}')
+
+        # One slice for all genes: rows first (cheap for CSR), then columns
+        x = source.X[self.cells][:, columns] if len(columns) > 0 else np.empty((len(self.cells), 0))
+        x = x.toarray() if sparse.issparse(x) else np.asarray(x)
+        values = pd.DataFrame(x, columns=var_keys)
+        for key in obs_keys:
+            values[key] = self.adata.obs[key].values[self.cells]
+        values = values[genes].to_numpy(dtype=float)
+
+        values = moving_average(values, self.n_avg)
+        if normalize:
+            values = normalize_to_zero_one(values)
+        return pd.DataFrame(values, columns=genes)
+
+    def frames(self, gene_sets: Dict[str, List[str]], normalize: bool = True) -> Dict[str, pd.DataFrame]:
+        """
+        Data for several gene sets, in the layout of `scanpy.pl.paga_path`'s
+        `return_data` (genes, then `groups`; `distance` with a
+        `dpt_pseudotime` annotation).
+        """
+        genes = [gene for gene_set in gene_sets.values() for gene in gene_set]
+        values = self.expression(genes, normalize=normalize)
+        groups = self.groups
+
+        frames = {}
+        for name, gene_set in gene_sets.items():
+            df = values[list(gene_set)].copy()
+            df['groups'] = groups
+            if 'dpt_pseudotime' in self.annotations:
+                df['distance'] = self.annotation('dpt_pseudotime')
+            frames[name] = df
+        return frames
+
+    def _default_colors(self) -> List[str]:
+        """Scanpy's default colours for the groups, without writing them into `adata.uns`."""
+        scratch = sc.AnnData(obs=pd.DataFrame(
+            {self.groups_key: pd.Categorical(self.categories, categories=self.categories)},
+            index=[str(i) for i in range(len(self.categories))],
+        ))
+        _set_default_colors_for_categorical_obs(scratch, self.groups_key)
+        return list(scratch.uns[f'{self.groups_key}_colors'])
+
+    def plot(
+        self,
+        df: pd.DataFrame,
+        ax: plt.Axes = None,
+        color_map: str = None,
+        color_maps_annotations: Dict[str, str] = {'dpt_pseudotime': 'Greys'},
+        palette_groups: List[str] = None,
+        title: str = None,
+        left_margin: float = None,
+        ytick_fontsize: int = None,
+        title_fontsize: int = None,
+        show_node_names: bool = True,
+        show_yticks: bool = True,
+        show_colorbar: bool = True,
+    ) -> plt.Axes:
+        """Heatmap of one of `frames`, laid out as `scanpy.pl.paga_path` does."""
+        ax = plt.gca() if ax is None else ax
+        keys = [c for c in df.columns if c not in ('groups', 'distance')]
+        x = df[keys].to_numpy().T
+
+        if palette_groups is None:
+            palette_groups = self.adata.uns.get(f'{self.groups_key}_colors')
+            if palette_groups is None or len(palette_groups) < len(self.categories):
+                palette_groups = self._default_colors()
+
+        img = ax.imshow(x, aspect='auto', interpolation='nearest', cmap=color_map)
+        if show_yticks:
+            ax.set_yticks(range(len(keys)))
+            ax.set_yticklabels(keys, fontsize=ytick_fontsize)
+        else:
+            ax.set_yticks([])
+        ax.set_frame_on(False)
+        ax.set_xticks([])
+        ax.tick_params(axis='both', which='both', length=0)
+        ax.grid(visible=False)
+        # On `ax`'s figure, not pyplot's current one (which may be another thread's)
+        fig = ax.figure
+        if show_colorbar:
+            fig.colorbar(img, ax=ax)
+        fig.subplots_adjust(left=0.2 if left_margin is None else left_margin)
+
+        # -- Groups bar
+        ax_bounds = ax.get_position().bounds
+        groups = df['groups'].to_numpy()[None, :]
+        groups_axis = fig.add_axes((
+            ax_bounds[0],
+            ax_bounds[1] - ax_bounds[3] / len(keys),
+            ax_bounds[2],
+            ax_bounds[3] / len(keys),
+        ))
+        lo, hi = int(np.min(groups)), int(np.max(groups))
+        groups_axis.imshow(
+            groups, aspect='auto', interpolation='nearest',
+            cmap=ListedColormap(list(palette_groups)[lo:], N=hi + 1 - lo),
+        )
+        if show_yticks:
+            groups_axis.set_yticklabels(['', self.groups_key, ''], fontsize=ytick_fontsize)
+        else:
+            groups_axis.set_yticks([])
+        if show_node_names:
+            ypos = sum(groups_axis.get_ylim()) / 2
+            for loc, label in zip(moving_average(self.tick_locs, 2), self.nodes):
+                groups_axis.text(loc, ypos, label, horizontalalignment='center', verticalalignment='center')
+        groups_axis.set_frame_on(False)
+        groups_axis.set_xticks([])
+        groups_axis.grid(visible=False)
+        groups_axis.tick_params(axis='both', which='both', length=0)
+
+        # -- Annotation bars
+        y_shift = ax_bounds[3] / len(keys)
+        for i, anno in enumerate(self.annotations):
+            if i > 0:
+                y_shift = ax_bounds[3] / len(keys) / 2
+            anno_axis = fig.add_axes((
+                ax_bounds[0],
+                ax_bounds[1] - (i + 2) * y_shift,
+                ax_bounds[2],
+                y_shift,
+            ))
+            is_categorical = isinstance(self._obs(anno).dtype, pd.CategoricalDtype)
+            cmap = color_maps_annotations.get(anno, 'tab10' if is_categorical else 'Greys')
+            anno_axis.imshow(self.annotation(anno)[None, :], aspect='auto', interpolation='nearest', cmap=cmap)
+            if show_yticks:
+                anno_axis.set_yticklabels(['', anno, ''], fontsize=ytick_fontsize)
+                anno_axis.tick_params(axis='both', which='both', length=0)
+            else:
+                anno_axis.set_yticks([])
+            anno_axis.set_frame_on(False)
+            anno_axis.set_xticks([])
+            anno_axis.grid(visible=False)
+
+        if title is not None:
+            ax.set_title(title, fontsize=title_fontsize)
+
+        return ax
+
+
+def save_frame(df: pd.DataFrame, save_path: Union[str, Path]) -> None:
+    save_path = Path(save_path)
+    if save_path.exists():
+        raise FileExistsError(f'File {save_path} already exists.')
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(save_path)
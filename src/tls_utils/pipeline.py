@@ -0,0 +1,249 @@
+import os
+from pathlib import Path
+import pickle
+import time
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+import scanpy as sc
+
+from TLS.src.tls_utils.anndata_extensions import TLSAnnDataAccessor
+from TLS.src.tls_utils.hashing import file_digest, fingerprint
+from TLS.src.tls_utils.step_memo import StepMemo, annotation_changes, annotation_digests, replay_changes
+
+
+class Step:
+    """
+    One call in a chain of `tls` accessor methods.
+
+    Parameters
+    ----------
+    method
+        Name of the accessor method (e.g., `'paga'` or `'query_timepoints'`),
+        or a function modifying an `AnnData` in place (e.g., `scv.tl.velocity`).
+    params
+        Keyword arguments for the method.
+    checkpoint
+        Whether to write the result of this step to the cache (for steps
+        that are expensive to recompute). Steps that only annotate the data
+        (`annotates`) are cached as the annotations they change regardless.
+    """
+
+    # Accessor methods that only write annotations, besides `scanpy.tl` functions
+    _annotating = ['assign_obs', 'assign_uns']
+
+    def __init__(self, method: Union[str, Callable], params: Dict = None, checkpoint: bool = False):
+        self.method = method
+        self.params = params or {}
+        self.checkpoint = checkpoint
+
+    @property
+    def name(self) -> str:
+        return self.method if isinstance(self.method, str) else f'{self.method.__module__}.{self.method.__name__}'
+
+    @property
+    def annotates(self) -> bool:
+        """Whether the step only changes annotations (`obs`, `obsm`, `obsp`, `uns`), not the data or its shape."""
+        if not isinstance(self.method, str):
+            return False
+        return (
+            self.method in self._annotating
+            or (hasattr(sc.tl, self.method) and self.method not in StepMemo._writes_X)
+        )
+
+    def __call__(self, accessor: TLSAnnDataAccessor) -> TLSAnnDataAccessor:
+        if isinstance(self.method, str):
+            return getattr(accessor, self.method)(**self.params)
+        accessor._materialize()
+        self.method(accessor._obj, **self.params)
+        return accessor
+
+    def __repr__(self):
+        return f'Step({self.name!r}, {self.params!r})'
+
+
+class CachedPipeline:
+    """
+    A chain of accessor `Step`s with a content-addressed on-disk cache.
+
+    Each step's key is the hash of the previous key, the step's method and
+    its parameters; the first key derives from the hash of the input file.
+    Results of the steps marked `checkpoint` are written to
+    `<cache_dir>/<key>.h5ad`, so re-running with unchanged inputs resumes
+    from the last checkpoint, and changing one step re-runs the steps after
+    the last checkpoint before it.
+
+    Steps that only annotate the data (e.g., `paga` or `louvain`) also
+    write the annotations they change to `<cache_dir>/<key>.annotations.pkl`.
+    On a re-run, these are replayed instead of running the step, so after
+    changing, e.g., the parameters of `louvain`, the annotation steps before
+    it are not recomputed; only the steps changing the data are.
+
+    Steps given as functions are keyed on their code, which does not cover
+    the libraries they call: pass a `version` (e.g., of scvelo) to key on.
+    """
+
+    def __init__(self, steps: List[Step], cache_dir: Union[str, Path], version: str = None):
+        self.steps = steps
+        self.cache_dir = Path(cache_dir)
+        self.version = version
+
+    def keys(self, path: Union[str, Path]) -> List[str]:
+        key = file_digest(path, memo_path=self.cache_dir / 'file_digests.json')
+        if self.version is not None:
+            key = fingerprint(key, self.version)
+        keys = []
+        for step in self.steps:
+            key = fingerprint(key, step.method, step.params)
+            keys.append(key)
+        return keys
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f'{key}.h5ad'
+
+    def _annotations_path(self, key: str) -> Path:
+        return self.cache_dir / f'{key}.annotations.pkl'
+
+    def _write(self, path: Path, write: Callable[[Path], None]) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename, so an interrupted run leaves no partial result
+        tmp_path = path.with_name(path.name + '.tmp')
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _run_step(self, step: Step, key: str, accessor: TLSAnnDataAccessor) -> TLSAnnDataAccessor:
+        if not step.annotates or step.checkpoint:
+            return step(accessor)
+
+        path = self._annotations_path(key)
+        if path.exists():
+            accessor._materialize(matrices=False)
+            with open(path, 'rb') as f:
+                replay_changes(accessor._obj, pickle.load(f))
+            return accessor
+
+        before = annotation_digests(accessor._obj)
+        accessor = step(accessor)
+        changes = annotation_changes(accessor._obj, before)
+
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(changes, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(path, write)
+        return accessor
+
+    def run(self, path: Union[str, Path], backed: str = 'r') -> TLSAnnDataAccessor:
+        keys = self.keys(path)
+
+        # Resume from the last step with a cached result
+        start = 0
+        accessor = None
+        for i in reversed(range(len(self.steps))):
+            if self.steps[i].checkpoint and self._path(keys[i]).exists():
+                accessor = TLSAnnDataAccessor.from_file(self._path(keys[i]))
+                start = i + 1
+                break
+
+        if accessor is None:
+            accessor = TLSAnnDataAccessor.from_file(path, backed=backed).lazy()
+
+        for i in range(start, len(self.steps)):
+            accessor = self._run_step(self.steps[i], keys[i], accessor)
+            if self.steps[i].checkpoint:
+                accessor._materialize()
+                self._write(self._path(keys[i]), accessor._obj.write_h5ad)
+
+        return accessor
+
+
+class Stage:
+    """
+    One function applied in place to an `AnnData`, declared by the named
+    products it reads and writes.
+
+    Products are `'X'`, or an attribute and key such as `'obsm/X_pca'`,
+    `'obs/S_score'` or `'uns/neighbors'`. A stage that updates a product
+    (e.g., `scale` on `'X'`) both reads and writes it.
+
+    Parameters
+    ----------
+    name
+        Label of the stage in reports.
+    func
+        Called as `func(adata, **params)`.
+    """
+
+    def __init__(self, name: str, func: Callable, params: Dict = None,
+                 reads: Iterable[str] = (), writes: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.params = params or {}
+        self.reads = list(reads)
+        self.writes = list(writes)
+
+    def __call__(self, adata: sc.AnnData) -> None:
+        self.func(adata, **self.params)
+
+    def __repr__(self):
+        return f'Stage({self.name!r}, reads={self.reads!r}, writes={self.writes!r})'
+
+
+class StagePipeline:
+    """
+    Stages run in order, pruned to those whose products reach `targets`.
+
+    Walking back from the targets, a stage is kept if it writes a product
+    still needed at that point, and its reads become needed in turn. Stages
+    whose outputs are never read, or are overwritten before being read,
+    are skipped (e.g., an embedding replaced by precomputed coordinates).
+
+    Notes
+    -----
+    - Products not written by any stage are taken from the input object.
+    - `report` (or `run(..., dry_run=True)`) lists what would run and why
+        the rest would be skipped, without computing anything.
+    """
+
+    def __init__(self, stages: List[Stage], targets: Iterable[str]):
+        self.stages = stages
+        self.targets = list(targets)
+
+    def plan(self) -> List[Tuple[Stage, bool, str]]:
+        """Each stage, whether it runs, and the products it is kept for (or why it is skipped)."""
+        needed = set(self.targets)
+        next_writer = {}
+        plan = []
+        for stage in reversed(self.stages):
+            kept_for = [product for product in stage.writes if product in needed]
+            if kept_for:
+                plan.append((stage, True, ', '.join(kept_for)))
+                needed.difference_update(stage.writes)
+                needed.update(stage.reads)
+            else:
+                reasons = [
+                    f'{product} overwritten by {next_writer[product]}' if product in next_writer
+                    else f'{product} unused'
+                    for product in stage.writes
+                ]
+                plan.append((stage, False, '; '.join(reasons)))
+            next_writer.update({product: stage.name for product in stage.writes})
+        return plan[::-1]
+
+    def report(self) -> str:
+        lines = []
+        for stage, run, reason in self.plan():
+            lines.append(f'{"run" if run else "skip":<6}{stage.name:<30}{"-> " if run else ""}{reason}')
+        return '\n'.join(lines)
+
+    def run(self, adata: sc.AnnData, dry_run: bool = False) -> sc.AnnData:
+        if dry_run:
+            print(self.report())
+            return adata
+
+        for stage, run, __ in self.plan():
+            if not run:
+                sc.logging.info(f'Skipping {stage.name}')
+                continue
+            start = time.perf_counter()
+            stage(adata)
+            sc.logging.info(f'{stage.name} ({time.perf_counter() - start:.1f}s)')
+        return adata
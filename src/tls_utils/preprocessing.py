@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+import scanpy as sc
+from scipy import sparse
+
+
+def _row_blocks(n_obs: int, block_size: int):
+    return [(start, min(start + block_size, n_obs)) for start in range(0, n_obs, block_size)]
+
+
+def _map_blocks(func, n_obs: int, block_size: int, max_workers: int = None) -> list:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda block: func(*block), _row_blocks(n_obs, block_size)))
+
+
+def _dense(X, start: int, stop: int, dtype) -> np.ndarray:
+    block = X[start:stop]
+    return block.toarray().astype(dtype, copy=False) if sparse.issparse(block) else np.array(block, dtype=dtype)
+
+
+def regress_out(
+    adata: sc.AnnData,
+    keys: Union[str, List[str]],
+    block_size: int = 2000,
+    max_workers: int = None,
+) -> None:
+    """
+    Regress out numeric `obs` keys from `X`, for all genes at once.
+
+    Every gene is fitted against the same design (an intercept and `keys`),
+    so the coefficients of all genes are one product with the design's
+    pseudo-inverse, read straight from sparse `X`. Residuals are then
+    written in blocks of `block_size` cells on a thread pool, into a single
+    dense matrix (as `sc.pp.regress_out` returns).
+
+    Notes
+    -----
+    - Same residuals as `sc.pp.regress_out` (ordinary least squares).
+    - A single categorical key is passed on to `sc.pp.regress_out`.
+    """
+    keys = [keys] if isinstance(keys, str) else list(keys)
+    if any(isinstance(adata.obs[key].dtype, pd.CategoricalDtype) for key in keys):
+        sc.pp.regress_out(adata, keys)
+        return
+
+    X = adata.X
+    dtype = X.dtype if np.issubdtype(X.dtype, np.floating) else np.float32
+    design = np.column_stack([np.ones(adata.n_obs), adata.obs[keys].to_numpy(dtype=float)])
+    # (genes x regressors) coefficients; X.T @ pinv.T keeps sparse X on the left
+    coefficients = np.asarray(X.T @ np.linalg.pinv(design).T)
+
+    residuals = np.empty(adata.shape, dtype=dtype)
+
+    def fit_block(start, stop):
+        residuals[start:stop] = _dense(X, start, stop, dtype) - design[start:stop] @ coefficients.T
+
+    _map_blocks(fit_block, adata.n_obs, block_size, max_workers)
+    adata.X = residuals
+
+
+def scale(
+    adata: sc.AnnData,
+    zero_center: bool = True,
+    max_value: float = None,
+    block_size: int = 2000,
+    max_workers: int = None,
+) -> None:
+    """
+    Scale each gene to unit variance (and zero mean), in blocks of cells.
+
+    Means and variances are accumulated over blocks of `block_size` cells,
+    which are then scaled on a thread pool. Dense `X` is scaled in place
+    (unless shared with `.raw`, or read-only, e.g. memory-mapped from a
+    `DatasetStore`); sparse `X` is densified block by block
+    with `zero_center`, and kept sparse (scaling only its non-zeros) without.
+
+    Notes
+    -----
+    - As `sc.pp.scale`: unbiased variances, genes with zero variance left
+        unscaled, `mean` and `std` saved to `var`, and clipping at
+        `max_value`.
+    """
+    X = adata.X
+    dtype = X.dtype if np.issubdtype(X.dtype, np.floating) else np.float32
+
+    def moments(start, stop):
+        block = X[start:stop]
+        if sparse.issparse(block):
+            return np.asarray(block.sum(axis=0)).ravel(), np.asarray(block.multiply(block).sum(axis=0)).ravel()
+        block = np.asarray(block, dtype=np.float64)
+        return block.sum(axis=0), np.square(block).sum(axis=0)
+
+    sums = _map_blocks(moments, adata.n_obs, block_size, max_workers)
+    mean = np.sum([s for s, __ in sums], axis=0) / adata.n_obs
+    var = (np.sum([s2 for __, s2 in sums], axis=0) / adata.n_obs - mean ** 2) * adata.n_obs / (adata.n_obs - 1)
+    std = np.sqrt(np.maximum(var, 0))
+    std[std == 0] = 1
+
+    adata.var['mean'] = mean
+    adata.var['std'] = std
+
+    if sparse.issparse(X) and not zero_center:
+        X = sparse.csr_matrix(X, dtype=dtype, copy=True)
+        X.data /= std[X.indices].astype(dtype)
+        if max_value is not None:
+            np.minimum(X.data, max_value, out=X.data)
+        adata.X = X
+        return
+
+    # In place, unless `.raw` shares the matrix or it can't be written
+    inplace = (
+        isinstance(X, np.ndarray) and X.flags.writeable and X.dtype == dtype
+        and (adata.raw is None or adata.raw.X is not X)
+    )
+    scaled = X if inplace else np.empty(adata.shape, dtype=dtype)
+    center = mean.astype(dtype) if zero_center else np.zeros_like(mean, dtype=dtype)
+    inv_std = (1 / std).astype(dtype)
+
+    def scale_block(start, stop):
+        block = scaled[start:stop] if scaled is X else _dense(X, start, stop, dtype)
+        block -= center
+        block *= inv_std
+        if max_value is not None:
+            np.clip(block, -max_value if zero_center else None, max_value, out=block)
+        scaled[start:stop] = block
+
+    _map_blocks(scale_block, adata.n_obs, block_size, max_workers)
+    adata.X = scaled
@@ -0,0 +1,128 @@
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+import scanpy as sc
+from scipy import sparse
+
+
+def _chunks(X, chunk_size: int):
+    for start in range(0, X.shape[0], chunk_size):
+        chunk = sparse.csr_matrix(X[start:min(start + chunk_size, X.shape[0])])
+        yield start, chunk
+
+
+def qc_metrics(
+    adata: sc.AnnData,
+    min_counts: float = None,
+    max_counts: float = None,
+    max_mt_frac: float = None,
+    min_genes: int = None,
+    mt_prefix: str = 'mt-',
+    chunk_size: int = 10000,
+) -> Tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """
+    Per-cell QC metrics, the cell mask and per-gene cell counts, in one pass.
+
+    Rows of `X` are read in chunks of `chunk_size` cells, so backed objects
+    are never loaded whole. Cell thresholds are applied as each chunk is
+    read, so genes are counted in passing cells only.
+
+    Returns
+    -------
+    The metrics (`n_counts`, `log_counts`, `n_genes`, `mt_frac`) as a frame
+    indexed like `obs`, the mask of cells passing every threshold, and the
+    number of passing cells expressing each gene.
+    """
+    n_obs, n_vars = adata.shape
+    mt_mask = np.asarray(adata.var_names.str.startswith(mt_prefix), dtype=float)
+
+    n_counts = np.zeros(n_obs)
+    n_genes = np.zeros(n_obs, dtype=np.int64)
+    mt_counts = np.zeros(n_obs)
+    passing = np.ones(n_obs, dtype=bool)
+    n_cells = np.zeros(n_vars, dtype=np.int64)
+
+    for start, chunk in _chunks(adata.X, chunk_size):
+        stop = start + chunk.shape[0]
+        rows = np.repeat(np.arange(chunk.shape[0]), np.diff(chunk.indptr))
+        expressed = chunk.data > 0
+
+        counts = np.bincount(rows, weights=chunk.data, minlength=chunk.shape[0])
+        genes = np.bincount(rows[expressed], minlength=chunk.shape[0])
+        mt = np.bincount(rows, weights=chunk.data * mt_mask[chunk.indices], minlength=chunk.shape[0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mt_frac = mt / counts
+
+        keep = np.ones(chunk.shape[0], dtype=bool)
+        if min_counts is not None:
+            keep &= counts >= min_counts
+        if max_counts is not None:
+            keep &= counts <= max_counts
+        if max_mt_frac is not None:
+            keep &= mt_frac < max_mt_frac
+        if min_genes is not None:
+            keep &= genes >= min_genes
+
+        n_cells += np.bincount(chunk.indices[expressed & keep[rows]], minlength=n_vars)
+        n_counts[start:stop], n_genes[start:stop], mt_counts[start:stop] = counts, genes, mt
+        passing[start:stop] = keep
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metrics = pd.DataFrame(
+            dict(
+                n_counts=n_counts,
+                log_counts=np.log(n_counts),
+                n_genes=n_genes,
+                mt_frac=mt_counts / n_counts,
+            ),
+            index=adata.obs_names,
+        )
+    return metrics, passing, n_cells
+
+
+def qc_filter(
+    adata: sc.AnnData,
+    min_counts: float = None,
+    max_counts: float = None,
+    max_mt_frac: float = None,
+    min_genes: int = None,
+    min_cells: int = None,
+    mt_prefix: str = 'mt-',
+    chunk_size: int = 10000,
+) -> sc.AnnData:
+    """
+    Compute QC metrics and keep the cells and genes passing all thresholds.
+
+    Equivalent to computing `n_counts`, `n_genes` and `mt_frac`, followed
+    by `filter_cells` (`min_counts`, `max_counts`, `min_genes`), a
+    `mt_frac < max_mt_frac` mask and `filter_genes(min_cells=...)`, but
+    with one pass over `X` and a single subset.
+
+    Notes
+    -----
+    - Thresholds left as `None` are not applied; without any, only the
+        metrics are added to `obs` (and `n_cells` to `var`).
+    - For backed objects, only the passing cells and genes are loaded.
+    """
+    metrics, cells, n_cells = qc_metrics(
+        adata,
+        min_counts=min_counts,
+        max_counts=max_counts,
+        max_mt_frac=max_mt_frac,
+        min_genes=min_genes,
+        mt_prefix=mt_prefix,
+        chunk_size=chunk_size,
+    )
+    genes = n_cells >= (min_cells or 0)
+
+    if cells.all() and genes.all() and not adata.isbacked:
+        filtered = adata
+    else:
+        filtered = adata[cells, genes]
+        filtered = filtered.to_memory() if adata.isbacked else filtered.copy()
+
+    for key, values in metrics.items():
+        filtered.obs[key] = values.values[cells]
+    filtered.var['n_cells'] = n_cells[genes]
+    return filtered
@@ -0,0 +1,338 @@
+from collections import OrderedDict
+from io import BytesIO
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Hashable, Sequence, Tuple, Union
+
+import matplotlib as mpl
+from matplotlib.colors import to_rgba_array
+import matplotlib.image as mpimg
+import numpy as np
+from PIL import Image, ImageDraw
+
+from TLS.src.tls_utils.hashing import fingerprint
+
+
+class EmbeddingRenderer:
+    """
+    Rasterises a 2D embedding straight into an RGBA buffer.
+
+    The coordinates are stored as `float32` and mapped to pixels once; each
+    render is a vectorised colour lookup plus a scatter into a numpy buffer,
+    without building any matplotlib artists.
+
+    Notes
+    -----
+    - Points are drawn in order, so later (for continuous values: higher)
+        points end up on top, as in `scanpy.pl.embedding` with `sort_order`.
+    - All renders of the same embedding share one extent, so selections
+        (e.g., a single timepoint) line up with the full data.
+    """
+
+    def __init__(
+        self,
+        coords: np.ndarray,
+        size: Tuple[int, int] = (400, 400),
+        point_radius: int = 2,
+        margin: float = 0.02,
+    ):
+        self.coords = np.asarray(coords, dtype=np.float32)
+        self.size = size
+        self.point_radius = point_radius
+
+        lo, hi = self.coords.min(axis=0), self.coords.max(axis=0)
+        span = np.where(hi > lo, hi - lo, 1) * (1 + 2 * margin)
+        self.extent = (lo - (span - (hi - lo)) / 2, span)
+
+        width, height = size
+        scaled = (self.coords - self.extent[0]) / self.extent[1]
+        self._px = np.clip((scaled[:, 0] * (width - 1)).round(), 0, width - 1).astype(np.int32)
+        # Image rows run top to bottom
+        self._py = np.clip(((1 - scaled[:, 1]) * (height - 1)).round(), 0, height - 1).astype(np.int32)
+
+        r = point_radius
+        stencil = [(dx, dy) for dx in range(-r, r + 1) for dy in range(-r, r + 1) if dx * dx + dy * dy <= r * r]
+        self._stencil = np.array(stencil, dtype=np.int32).reshape(-1, 2)
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """Extent of the image in embedding coordinates (left, right, bottom, top)."""
+        (x0, y0), (dx, dy) = self.extent
+        return (float(x0), float(x0 + dx), float(y0), float(y0 + dy))
+
+    def _draw(self, cells: np.ndarray, colors: np.ndarray) -> np.ndarray:
+        width, height = self.size
+        rgba = np.zeros((height, width, 4), dtype=np.uint8)
+        if len(cells) == 0:
+            return rgba
+
+        # Stamp every point with the stencil, then keep the last point per pixel
+        px = (self._px[cells][None, :] + self._stencil[:, :1]).ravel()
+        py = (self._py[cells][None, :] + self._stencil[:, 1:]).ravel()
+        order = np.tile(np.arange(len(cells)), len(self._stencil))
+        inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+        flat, order = (py * width + px)[inside], order[inside]
+
+        by_order = np.argsort(order, kind='stable')[::-1]
+        flat, order = flat[by_order], order[by_order]
+        __, first = np.unique(flat, return_index=True)
+
+        rgba.reshape(-1, 4)[flat[first]] = colors[order[first]]
+        return rgba
+
+    def render_values(
+        self,
+        values: np.ndarray,
+        cells: np.ndarray = None,
+        cmap: str = 'viridis',
+        vmin: float = None,
+        vmax: float = None,
+    ) -> np.ndarray:
+        """RGBA image of `cells` coloured by continuous `values` (one per cell)."""
+        cells = np.arange(len(self.coords)) if cells is None else np.asarray(cells)
+        values = np.asarray(values, dtype=np.float32)
+
+        vmin = np.nanmin(values) if vmin is None else vmin
+        vmax = np.nanmax(values) if vmax is None else vmax
+        scaled = (values - vmin) / (vmax - vmin) if vmax > vmin else np.zeros_like(values)
+        lut = (mpl.colormaps[cmap](np.linspace(0, 1, 256)) * 255).astype(np.uint8)
+        colors = lut[np.clip(np.nan_to_num(scaled) * 255, 0, 255).astype(np.intp)]
+
+        # Draw high values last
+        order = np.argsort(values, kind='stable')
+        return self._draw(cells[order], colors[order])
+
+    def render_categories(
+        self,
+        codes: np.ndarray,
+        palette: Sequence[str],
+        cells: np.ndarray = None,
+    ) -> np.ndarray:
+        """RGBA image of `cells` coloured by categorical `codes` (one per cell)."""
+        cells = np.arange(len(self.coords)) if cells is None else np.asarray(cells)
+        lut = (to_rgba_array(palette) * 255).astype(np.uint8)
+        codes = np.asarray(codes)
+        keep = codes >= 0
+        return self._draw(cells[keep], lut[codes[keep]])
+
+    @staticmethod
+    def colorbar(
+        rgba: np.ndarray,
+        cmap: str = 'viridis',
+        height: int = 8,
+        vmin: float = None,
+        vmax: float = None,
+    ) -> np.ndarray:
+        """
+        Append a horizontal colour gradient (low to high) below `rgba`,
+        labelled with `vmin` and `vmax` at its ends if given.
+        """
+        lut = (mpl.colormaps[cmap](np.linspace(0, 1, rgba.shape[1])) * 255).astype(np.uint8)
+        bar = np.broadcast_to(lut[None, :, :], (height, rgba.shape[1], 4))
+        gap = np.zeros((height // 2, rgba.shape[1], 4), dtype=np.uint8)
+        parts = [rgba, gap, bar]
+        if vmin is not None and vmax is not None:
+            parts.append(EmbeddingRenderer._labels(rgba.shape[1], f'{vmin:.3g}', f'{vmax:.3g}'))
+        return np.concatenate(parts)
+
+    @staticmethod
+    def _labels(width: int, left: str, right: str, height: int = 14) -> np.ndarray:
+        """RGBA strip with `left` and `right` drawn in black at its ends."""
+        strip = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(strip)
+        draw.text((0, 1), left, fill=(0, 0, 0, 255))
+        draw.text((width - draw.textlength(right), 1), right, fill=(0, 0, 0, 255))
+        return np.asarray(strip, dtype=np.uint8)
+
+    @staticmethod
+    def to_png(rgba: np.ndarray) -> bytes:
+        buffer = BytesIO()
+        mpimg.imsave(buffer, rgba, format='png')
+        return buffer.getvalue()
+
+    @staticmethod
+    def from_png(png: bytes) -> np.ndarray:
+        return (mpimg.imread(BytesIO(png), format='png') * 255).astype(np.uint8)
+
+
+class RenderCache:
+    """
+    Rendered images (PNG bytes), keyed by what was rendered.
+
+    One instance (`render_cache`) is shared by everything running in the
+    same process, e.g., the app's pages (all sessions) and the plotting
+    functions.
+
+    Notes
+    -----
+    - Holds at most `max_bytes` of images, evicting the least recently used;
+        with `ttl` (seconds), images are also dropped that long after being
+        rendered.
+    - Safe to use from several threads. With `get_or_render`, concurrent
+        requests for the same key render it once and the others wait.
+    - Images are immutable `bytes`, so they can be handed to any session.
+    - With `disk_dir`, images rendered with `persist` (keys that are stable
+        across processes, e.g., starting with a dataset store's version)
+        are also written there, one file per key, and read back on a miss;
+        they are shared by processes and survive restarts (see
+        `scripts/render_cache`). Files expire `ttl` after being written
+        (by modification time), and the least recently written are deleted
+        beyond `max_disk_bytes`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 2**20,
+        ttl: float = None,
+        clock: Callable[[], float] = time.monotonic,
+        disk_dir: Union[str, Path] = None,
+        max_disk_bytes: int = 2 * 2**30,
+    ):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._images = OrderedDict()  # key -> (png, expiry), least recent first
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._rendering = {}  # key -> lock held while rendering
+        self.set_disk_dir(disk_dir)
+
+    def set_disk_dir(self, disk_dir: Union[str, Path, None]) -> None:
+        self.disk_dir = None if disk_dir is None else Path(disk_dir)
+        self._disk_nbytes = None  # written since the last prune, once known
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._images)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def _pop(self, key: Hashable) -> None:
+        png, __ = self._images.pop(key)
+        self._nbytes -= len(png)
+
+    def _disk_path(self, key: Hashable) -> Path:
+        return self.disk_dir / f'{fingerprint(key)}.png'
+
+    def get(self, key: Hashable, persist: bool = False) -> bytes:
+        with self._lock:
+            entry = self._images.get(key)
+            if entry is not None:
+                png, expiry = entry
+                if expiry is None or self._clock() < expiry:
+                    self._images.move_to_end(key)
+                    return png
+                self._pop(key)
+
+        if persist and self.disk_dir is not None:
+            return self._get_disk(key)
+        return None
+
+    def _get_disk(self, key: Hashable) -> bytes:
+        # The file can be replaced or deleted (by a prune) at any point
+        path = self._disk_path(key)
+        try:
+            age = time.time() - path.stat().st_mtime
+            if self.ttl is not None and age >= self.ttl:
+                path.unlink()
+                return None
+            png = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # Kept in memory no longer than the file itself
+        return self._put_memory(key, png, ttl=None if self.ttl is None else self.ttl - age)
+
+    def put(self, key: Hashable, png: bytes, persist: bool = False) -> bytes:
+        png = self._put_memory(key, bytes(png))
+        if persist and self.disk_dir is not None:
+            # Write-then-rename, so readers never see a partial image
+            path = self._disk_path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f'.png.tmp-{os.getpid()}-{threading.get_ident()}')
+            tmp_path.write_bytes(png)
+            os.replace(tmp_path, path)
+            with self._lock:
+                if self._disk_nbytes is not None:
+                    self._disk_nbytes += len(png)
+                prune = self._disk_nbytes is None or self._disk_nbytes > self.max_disk_bytes
+            if prune:
+                self.prune_disk()
+        return png
+
+    def prune_disk(self) -> None:
+        """Delete expired images from `disk_dir`, then the least recently written beyond `max_disk_bytes`."""
+        now, files = time.time(), []
+        for path in self.disk_dir.glob('*.png'):
+            try:
+                stat = path.stat()
+                if self.ttl is not None and now - stat.st_mtime >= self.ttl:
+                    path.unlink()
+                else:
+                    files.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                continue
+
+        nbytes = 0
+        for __, size, path in sorted(files, key=lambda file: file[0], reverse=True):
+            if nbytes + size > self.max_disk_bytes:
+                path.unlink(missing_ok=True)
+            else:
+                nbytes += size
+        with self._lock:
+            self._disk_nbytes = nbytes
+
+    def _put_memory(self, key: Hashable, png: bytes, ttl: float = None) -> bytes:
+        if len(png) > self.max_bytes:
+            return png
+
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            if key in self._images:
+                self._pop(key)
+            expiry = None if ttl is None else self._clock() + ttl
+            self._images[key] = (png, expiry)
+            self._nbytes += len(png)
+            while self._nbytes > self.max_bytes:
+                self._pop(next(iter(self._images)))
+        return png
+
+    def get_or_render(self, key: Hashable, render: Callable[[], bytes], persist: bool = False) -> bytes:
+        """
+        The image for `key`, rendered (once, across threads) by `render()`
+        if missing. A `None` key is rendered without caching; with
+        `persist`, the image is also read from and written to `disk_dir`.
+        """
+        if key is None:
+            return render()
+
+        png = self.get(key, persist)
+        if png is not None:
+            return png
+
+        with self._lock:
+            key_lock = self._rendering.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                png = self.get(key, persist)
+                if png is None:
+                    png = self.put(key, render(), persist)
+            finally:
+                with self._lock:
+                    if self._rendering.get(key) is key_lock:
+                        del self._rendering[key]
+        return png
+
+    def clear(self) -> None:
+        with self._lock:
+            self._images.clear()
+            self._nbytes = 0
+
+
+render_cache = RenderCache(ttl=24 * 3600)
@@ -0,0 +1,225 @@
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+import scanpy as sc
+from scipy import sparse
+from scipy.sparse import linalg
+
+# Weight of the per-cell equations keeping the pooled system solvable (as in scran)
+_LOW_WEIGHT = 1e-6
+
+
+def _ring(lib_sizes: np.ndarray) -> np.ndarray:
+    """Cells ordered by library size, odd ranks up and even ranks down (scran's 'sphere')."""
+    order = np.argsort(lib_sizes, kind='stable')
+    return np.concatenate([order[0::2], order[1::2][::-1]])
+
+
+def _limit_cluster_size(codes: np.ndarray, max_cluster_size: int) -> list:
+    """
+    Clusters split into parts of at most `max_cluster_size` cells.
+
+    Cells are dealt out round-robin, as in scran's `.limit_cluster_size`,
+    so parts don't follow the order of the cells (e.g., by sample).
+    """
+    indices = []
+    for code in np.unique(codes):
+        idcs = np.flatnonzero(codes == code)
+        n_splits = int(np.ceil(len(idcs) / max_cluster_size))
+        parts = np.arange(len(idcs)) % n_splits
+        indices.extend(idcs[parts == k] for k in range(n_splits))
+    return indices
+
+
+def _pool_system(exprs: sparse.csr_matrix, ave_cell: np.ndarray, ring: np.ndarray, sizes: np.ndarray,
+                 block_size: int):
+    """Equations `sum(factors of pool) = median(pooled / ave_cell)`, one per pool."""
+    n_cells = exprs.shape[0]
+    cycle = np.concatenate([ring, ring])
+    medians = np.empty((len(sizes), n_cells))
+
+    for start in range(0, n_cells, block_size):
+        stop = min(start + block_size, n_cells)
+        # Running sums over the block's cells: any window is a difference of two rows
+        block = exprs[cycle[start:stop + sizes.max() - 1]].toarray()
+        cumsum = np.zeros((block.shape[0] + 1, block.shape[1]))
+        np.cumsum(block, axis=0, out=cumsum[1:])
+        for i, size in enumerate(sizes):
+            pooled = cumsum[size:size + stop - start] - cumsum[:stop - start]
+            medians[i, start:stop] = np.median(pooled / ave_cell, axis=1)
+
+    rows = np.concatenate([
+        np.repeat(np.arange(i * n_cells, (i + 1) * n_cells), size) for i, size in enumerate(sizes)
+    ])
+    cols = np.concatenate([
+        cycle[(np.arange(n_cells)[:, None] + np.arange(size)).ravel()] for size in sizes
+    ])
+    values = np.ones(len(rows))
+
+    # Per-cell equations, weighted low, so that the system is always solvable
+    n_pools = len(sizes) * n_cells
+    rows = np.concatenate([rows, n_pools + np.arange(n_cells)])
+    cols = np.concatenate([cols, np.arange(n_cells)])
+    values = np.concatenate([values, np.full(n_cells, np.sqrt(_LOW_WEIGHT))])
+    output = np.concatenate([medians.ravel(), np.full(n_cells, np.sqrt(_LOW_WEIGHT) / ave_cell.sum())])
+
+    design = sparse.csr_matrix((values, (rows, cols)), shape=(n_pools + n_cells, n_cells))
+    return design, output
+
+
+def _cluster_factors(X: sparse.csr_matrix, sizes: np.ndarray, min_mean: float, block_size: int):
+    lib_sizes = np.asarray(X.sum(axis=1)).ravel()
+    exprs = sparse.diags(1 / lib_sizes) @ X
+    ave_cell = np.asarray(exprs.mean(axis=0)).ravel()
+
+    genes = slice(None)
+    if min_mean is not None:
+        genes = ave_cell * lib_sizes.mean() >= min_mean
+    exprs = sparse.csr_matrix(exprs[:, genes])
+
+    design, output = _pool_system(exprs, ave_cell[genes], _ring(lib_sizes), sizes, block_size)
+    # Least squares through the normal equations (sparse and banded along the ring)
+    factors = linalg.spsolve((design.T @ design).tocsc(), design.T @ output)
+    return factors * lib_sizes, ave_cell, lib_sizes.mean()
+
+
+def _rescale_clusters(profiles: list, mean_libs: list, ref: int, min_mean: float) -> np.ndarray:
+    rescaling = np.empty(len(profiles))
+    for i, (profile, mean_lib) in enumerate(zip(profiles, mean_libs)):
+        cur, ref_profile = profile, profiles[ref]
+        if min_mean is not None:
+            use = (cur * mean_lib + ref_profile * mean_libs[ref]) / 2 >= min_mean
+            cur, ref_profile = cur[use], ref_profile[use]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rescaling[i] = np.nanmedian(cur / ref_profile)
+    return rescaling
+
+
+def pooled_size_factors(
+    X,
+    clusters: Iterable = None,
+    sizes: Iterable[int] = range(21, 102, 5),
+    min_mean: float = 0.1,
+    max_cluster_size: int = 3000,
+    ref_cluster=None,
+    block_size: int = 256,
+) -> np.ndarray:
+    """
+    Pooled (deconvolution) size factors, as scran's `computeSumFactors`.
+
+    Within each cluster, cells are arranged in a ring by library size and
+    summed over sliding windows of each pool size. The median ratio of
+    each pool to the average cell gives one equation on the sum of its
+    cells' factors, and the sparse system is solved by least squares.
+    Clusters are then rescaled by the median ratio of their average cells
+    to the reference cluster's, and factors centred at 1.
+
+    Parameters
+    ----------
+    X
+        Raw counts (cells x genes), sparse or dense.
+    clusters
+        Cluster of each cell (e.g., a quick `louvain`); all cells are
+        pooled together if not given.
+    sizes
+        Pool sizes; each cluster needs at least `max(sizes)` cells.
+    min_mean
+        Minimum average count of the genes used, within and across clusters.
+    ref_cluster
+        Cluster the others are rescaled to (default: the one with most
+        genes expressed).
+
+    Notes
+    -----
+    - Works on `X` as it is (CSR, cells as rows): no dense or transposed
+        copy is made, beyond `block_size` rows of used genes at a time.
+    """
+    X = sparse.csr_matrix(X, dtype=np.float64)
+    sizes = np.sort(np.asarray(list(sizes)))
+    if clusters is None:
+        clusters = np.zeros(X.shape[0], dtype=int)
+    clusters = pd.Categorical(np.asarray(clusters))
+
+    indices = _limit_cluster_size(clusters.codes, max_cluster_size)
+    for idcs in indices:
+        if len(idcs) < sizes.max():
+            raise ValueError(f'Not enough cells in a cluster ({len(idcs)}) for pools of {sizes.max()}.')
+
+    factors, profiles, mean_libs = [], [], []
+    for idcs in indices:
+        cluster_factors, profile, mean_lib = _cluster_factors(X[idcs], sizes, min_mean, block_size)
+        factors.append(cluster_factors)
+        profiles.append(profile)
+        mean_libs.append(mean_lib)
+
+    if ref_cluster is None:
+        ref = int(np.argmax([(profile > 0).sum() for profile in profiles]))
+    else:
+        code = clusters.categories.get_loc(ref_cluster)
+        ref = next(i for i, idcs in enumerate(indices) if clusters.codes[idcs[0]] == code)
+    rescaling = _rescale_clusters(profiles, mean_libs, ref, min_mean)
+
+    size_factors = np.empty(X.shape[0])
+    for idcs, cluster_factors, scale in zip(indices, factors, rescaling):
+        size_factors[idcs] = cluster_factors * scale
+
+    positive = size_factors > 0
+    if not positive.all():
+        sc.logging.warning(f'{(~positive).sum()} cells with non-positive size factors; '
+                           'consider filtering low-quality cells.')
+    return size_factors / size_factors[positive].mean()
+
+
+def normalize_size_factors(
+    adata: sc.AnnData,
+    key: str = 'size_factors',
+    counts_layer: str = 'counts',
+    log: bool = True,
+    raw: bool = True,
+    chunk_size: int = 10000,
+) -> None:
+    """
+    Divide each cell by its size factor and `log1p`, in place on the CSR data.
+
+    Only the non-zeros of `X` are touched: rows are scaled and logged on
+    `X.data`, in chunks of `chunk_size` cells, so no dense or second sparse
+    matrix is made.
+
+    Parameters
+    ----------
+    key
+        `obs` column with the size factors.
+    counts_layer
+        Layer to keep the raw counts in (`None` to drop them). It shares
+        `indices` and `indptr` with `X`, costing one extra `data` array.
+    raw
+        Set `.raw` to the normalised matrix (shared with `X`, not copied).
+
+    Notes
+    -----
+    - As `.raw` shares `X`, later steps should replace `X` (as `regress_out`
+        and `scale` do) rather than modify it in place.
+    """
+    X = adata.X
+    if not sparse.isspmatrix_csr(X):
+        X = sparse.csr_matrix(X)
+    if not np.issubdtype(X.dtype, np.floating):
+        X = X.astype(np.float32)
+
+    if counts_layer is not None:
+        adata.layers[counts_layer] = sparse.csr_matrix((X.data.copy(), X.indices, X.indptr), shape=X.shape)
+
+    scale = 1 / adata.obs[key].to_numpy(dtype=X.dtype)
+    for start in range(0, X.shape[0], chunk_size):
+        stop = min(start + chunk_size, X.shape[0])
+        data = X.data[X.indptr[start]:X.indptr[stop]]
+        data *= np.repeat(scale[start:stop], np.diff(X.indptr[start:stop + 1]))
+        if log:
+            np.log1p(data, out=data)
+
+    adata.X = X
+    if log:
+        adata.uns['log1p'] = {'base': None}
+    if raw:
+        adata.raw = adata
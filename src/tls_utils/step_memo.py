@@ -0,0 +1,151 @@
+from collections import OrderedDict
+import pickle
+from typing import Callable, Dict, Hashable, Tuple
+
+import scanpy as sc
+
+from TLS.src.tls_utils.hashing import data_digest, fingerprint
+
+
+ANNOTATION_ATTRS = ['obs', 'obsm', 'obsp', 'uns']
+
+
+def annotation_digests(adata: sc.AnnData) -> Dict[str, Dict[str, str]]:
+    """Digest of each entry of the annotations (`ANNOTATION_ATTRS`) of `adata`."""
+    return {
+        attr: {key: data_digest(value) for key, value in getattr(adata, attr).items()}
+        for attr in ANNOTATION_ATTRS
+    }
+
+
+def annotation_changes(adata: sc.AnnData, before: Dict, after: Dict = None) -> Dict:
+    """
+    Entries of the annotations set or deleted between the `before` and
+    `after` digests (`annotation_digests`; by default, of `adata` now).
+    """
+    after = annotation_digests(adata) if after is None else after
+    return {
+        attr: {
+            'set': {
+                key: getattr(adata, attr)[key]
+                for key, digest in after[attr].items()
+                if before[attr].get(key) != digest
+            },
+            'del': [key for key in before[attr] if key not in after[attr]],
+        }
+        for attr in ANNOTATION_ATTRS
+    }
+
+
+def replay_changes(adata: sc.AnnData, changes: Dict) -> None:
+    """Apply `annotation_changes` to `adata`."""
+    for attr, change in changes.items():
+        mapping = getattr(adata, attr)
+        for key in change['del']:
+            del mapping[key]
+        for key, value in change['set'].items():
+            mapping[key] = value
+
+
+class StepMemo:
+    """
+    LRU memo of the annotations that scanpy functions add to an `AnnData`.
+
+    A call is keyed on the function, its keyword arguments and digests of
+    the object's `obs`, `obsm`, `obsp` and `uns` (and of `X`, `var_names`
+    and `raw` for functions that may read the expression matrix). On a hit,
+    the recorded changes to those attributes are replayed instead of
+    running the function.
+
+    Notes
+    -----
+    - Changes are stored pickled, so replays never share objects and the
+        memo's size (`max_bytes`) is exact.
+    - Calls that change `X` or the shape of the object are not memoised;
+        functions known to (`_writes_X`) are run without digesting anything.
+    """
+
+    # Functions that only read annotations, never the expression matrix
+    _skip_X = ['paga', 'dpt', 'louvain', 'leiden', 'diffmap', 'draw_graph', 'embedding_density']
+    # Functions that modify the expression matrix (or the shape) in place
+    _writes_X = [
+        'scale', 'regress_out', 'log1p', 'sqrt', 'normalize_total', 'normalize_per_cell',
+        'combat', 'downsample_counts', 'filter_cells', 'filter_genes', 'subsample',
+        'recipe_seurat', 'recipe_weinreb17', 'recipe_zheng17', 'magic',
+    ]
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 2 * 1024 ** 3):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def n_bytes(self) -> int:
+        return self._n_bytes
+
+    def _snapshot(self, adata: sc.AnnData, with_X: bool) -> Dict[str, Dict[str, str]]:
+        snapshot = annotation_digests(adata)
+        snapshot['obs_names'] = {'': data_digest(adata.obs_names)}
+        if with_X:
+            snapshot['X'] = {
+                'X': data_digest(adata.X),
+                'var_names': data_digest(adata.var_names),
+                'raw': data_digest(adata.raw.X) if adata.raw is not None else '',
+            }
+        return snapshot
+
+    def _key(self, func: Callable, kwargs: Dict, snapshot: Dict) -> Tuple[str, str]:
+        return (func.__name__, fingerprint(func.__module__, kwargs, snapshot))
+
+    def call(self, func: Callable, adata: sc.AnnData, kwargs: Dict) -> None:
+        """Run `func(adata, **kwargs)`, or replay its recorded changes."""
+        if func.__name__ in self._writes_X:
+            func(adata, **kwargs)
+            return
+
+        with_X = func.__name__ not in self._skip_X
+        before = self._snapshot(adata, with_X)
+        key = self._key(func, kwargs, before)
+
+        delta = self._entries.get(key)
+        if delta is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            replay_changes(adata, pickle.loads(delta))
+            return
+
+        self.misses += 1
+        shape = adata.shape
+        func(adata, **kwargs)
+        if adata.shape != shape:
+            return
+
+        after = self._snapshot(adata, with_X)
+        if with_X and after['X'] != before['X']:
+            return
+
+        changes = annotation_changes(adata, before, after)
+        self._put(key, pickle.dumps(changes, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _put(self, key: Hashable, delta: bytes) -> None:
+        if len(delta) > self.max_bytes:
+            return
+        self._entries[key] = delta
+        self._n_bytes += len(delta)
+        while len(self._entries) > self.max_entries or self._n_bytes > self.max_bytes:
+            __, evicted = self._entries.popitem(last=False)
+            self._n_bytes -= len(evicted)
+
+    def invalidate(self, func_name: str = None) -> None:
+        """Forget the calls of `func_name` (e.g., `'dpt'`), or all calls."""
+        for key in [k for k in self._entries if func_name is None or k[0] == func_name]:
+            self._n_bytes -= len(self._entries.pop(key))
+
+
+step_memo = StepMemo()
@@ -0,0 +1,173 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import multiprocessing as mp
+from typing import Dict, List, Tuple
+
+import numpy as np
+import scanpy as sc
+from scipy import sparse
+
+# Arrays of a worker process, set by its initializer (never in the caller's process)
+_worker_arrays = {}
+
+
+def _init_worker(arrays: Dict) -> None:
+    _worker_arrays.update(arrays)
+
+
+def _worker_block_cosines(start: int, stop: int) -> np.ndarray:
+    return _block_cosines(_worker_arrays, start, stop)
+
+
+def _neighbor_indices(distances: sparse.csr_matrix) -> np.ndarray:
+    """The `k` nearest neighbours of each cell, `k` being the smallest count (as scvelo's `get_indices`)."""
+    distances = sparse.csr_matrix(distances, copy=True)
+    distances.data += 1e-6
+    counts = np.diff(distances.indptr)
+    n_neighbors = counts.min()
+    for row in np.flatnonzero(counts > n_neighbors):
+        start, stop = distances.indptr[row], distances.indptr[row + 1]
+        distances.data[start + np.argsort(distances.data[start:stop])[n_neighbors:]] = 0
+    distances.eliminate_zeros()
+    return distances.indices.reshape((-1, n_neighbors))
+
+
+def _reach(indices: np.ndarray, n_recurse_neighbors: int) -> sparse.csr_matrix:
+    """Cells within `n_recurse_neighbors` steps of each cell (itself included), as a pattern."""
+    n_obs, n_neighbors = indices.shape
+    step = sparse.csr_matrix(
+        (np.ones(indices.size, dtype=np.float32), indices.ravel(), np.arange(0, indices.size + 1, n_neighbors)),
+        shape=(n_obs, n_obs),
+    ) + sparse.identity(n_obs, dtype=np.float32, format='csr')
+    reach = step
+    for __ in range(n_recurse_neighbors - 1):
+        reach = reach @ step
+    reach.sort_indices()
+    return reach
+
+
+def _blocks(indptr: np.ndarray, max_transitions: int) -> List[Tuple[int, int]]:
+    """Consecutive cells with at most `max_transitions` transitions in all (or one cell)."""
+    n_obs = len(indptr) - 1
+    blocks, start = [], 0
+    while start < n_obs:
+        stop = np.searchsorted(indptr, indptr[start] + max_transitions, side='right') - 1
+        stop = min(max(stop, start + 1), n_obs)
+        blocks.append((start, stop))
+        start = stop
+    return blocks
+
+
+def _block_cosines(arrays: Dict, start: int, stop: int) -> np.ndarray:
+    """Cosines of the transitions of cells `start:stop`, in the order of `reach`'s entries."""
+    X, V, reach = arrays['X'], arrays['V'], arrays['reach']
+    indptr = reach.indptr[start:stop + 1] - reach.indptr[start]
+    cols = reach.indices[reach.indptr[start]:reach.indptr[stop]]
+
+    # Displacements of all the block's transitions at once, modified in place
+    dX = X[cols]
+    for i, cell in enumerate(range(start, stop)):
+        dX[indptr[i]:indptr[i + 1]] -= X[cell]
+    if arrays['sqrt_transform']:
+        np.copysign(np.sqrt(np.abs(dX)), dX, out=dX)
+
+    dX -= dX.mean(axis=1)[:, None]
+
+    dot = np.empty(len(cols), dtype=dX.dtype)
+    for i, cell in enumerate(range(start, stop)):
+        dot[indptr[i]:indptr[i + 1]] = dX[indptr[i]:indptr[i + 1]] @ V[cell]
+    norms = np.sqrt(np.einsum('ij,ij->i', dX, dX)) * np.repeat(np.linalg.norm(V[start:stop], axis=1), np.diff(indptr))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosines = dot / norms
+    cosines[np.isnan(cosines)] = 0
+    return cosines
+
+
+def _velocity_arrays(adata: sc.AnnData, vkey: str, xkey: str) -> Tuple[np.ndarray, np.ndarray]:
+    genes = np.ones(adata.n_vars, dtype=bool)
+    if f'{vkey}_genes' in adata.var:
+        genes &= adata.var[f'{vkey}_genes'].to_numpy(dtype=bool)
+    xkey = xkey if xkey in adata.layers else 'spliced'
+
+    def dense(layer):
+        values = adata.layers[layer][:, genes]
+        return np.asarray(values.toarray() if sparse.issparse(values) else values, dtype=np.float32)
+
+    X, V = dense(xkey), dense(vkey)
+    finite = ~np.isnan(V.sum(axis=0))
+    return X[:, finite], V[:, finite]
+
+
+def velocity_graph(
+    adata: sc.AnnData,
+    vkey: str = 'velocity',
+    xkey: str = 'Ms',
+    n_recurse_neighbors: int = 2,
+    sqrt_transform: bool = None,
+    max_block_bytes: int = 4 * 2**20,
+    max_workers: int = None,
+    processes: bool = False,
+) -> None:
+    """
+    Cosine correlations of velocities with cell transitions, as `scv.tl.velocity_graph`.
+
+    For each cell, the displacements to the cells within `n_recurse_neighbors`
+    steps of the existing neighbour graph are correlated with its velocity.
+    Cells are processed in blocks, as one vectorised computation per block,
+    on a pool of workers. Blocks are sized by their transitions, so the
+    displacements of a block (transitions x genes) take at most
+    `max_block_bytes` per worker, however many neighbours cells have.
+
+    Notes
+    -----
+    - Covers scvelo's defaults (neighbours from `distances`, full gene
+        space): no `basis`, `tkey`, `approx`, or uncertainties.
+    - Adds `{vkey}_graph` and `{vkey}_graph_neg` (CSR) to `uns` and
+        `{vkey}_self_transition` to `obs`, as scvelo does.
+    - Threads are used by default: the per-block work is numpy, which
+        releases the GIL. With `processes`, workers are started from a
+        `forkserver` (forking a process that has numba or OpenMP threads
+        can hang) and each receives a copy of the arrays.
+    """
+    X, V = _velocity_arrays(adata, vkey, xkey)
+    if sqrt_transform is None:
+        sqrt_transform = adata.uns.get(f'{vkey}_params', {}).get('mode') == 'stochastic'
+    if sqrt_transform:
+        V = np.sqrt(np.abs(V)) * np.sign(V)
+    V -= np.nanmean(V, axis=1)[:, None]
+
+    distances = adata.obsp['distances'] if 'distances' in adata.obsp else adata.uns['neighbors']['distances']
+    reach = _reach(_neighbor_indices(distances), n_recurse_neighbors)
+    # Cells without velocity have no transitions
+    moving = (V != 0).any(axis=1)
+    reach = sparse.diags(moving.astype(np.float32)) @ reach
+    reach.eliminate_zeros()
+
+    blocks = _blocks(reach.indptr, max(max_block_bytes // (X.shape[1] * X.itemsize), 1))
+    arrays = dict(X=X, V=V, reach=reach, sqrt_transform=sqrt_transform)
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context('forkserver'),
+                                       initializer=_init_worker, initargs=(arrays,))
+        block_cosines = _worker_block_cosines
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        block_cosines = partial(_block_cosines, arrays)
+    with executor:
+        cosines = np.concatenate(list(executor.map(block_cosines, *zip(*blocks))))
+
+    graph = sparse.csr_matrix((cosines, reach.indices, reach.indptr), shape=reach.shape)
+    graph_neg = graph.copy()
+    graph.data = np.clip(graph.data, 0, 1)
+    graph_neg.data = np.clip(graph_neg.data, -1, 0)
+    graph.eliminate_zeros()
+    graph_neg.eliminate_zeros()
+
+    confidence = graph.max(axis=1).toarray().ravel()
+    adata.uns[f'{vkey}_graph'] = graph
+    adata.uns[f'{vkey}_graph_neg'] = graph_neg
+    adata.obs[f'{vkey}_self_transition'] = np.clip(np.percentile(confidence, 98) - confidence, 0, 1)
+
+    params = adata.uns.setdefault(f'{vkey}_params', {})
+    params.pop('embeddings', None)
+    params['mode_neighbors'] = 'distances'
+    params['n_recurse_neighbors'] = n_recurse_neighbors